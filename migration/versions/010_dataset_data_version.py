@@ -0,0 +1,11 @@
+from sqlalchemy import *
+from migrate import *
+
+meta = MetaData()
+
+def upgrade(migrate_engine):
+    meta.bind = migrate_engine
+    dataset = Table('dataset', meta, autoload=True)
+
+    v = Column('data_version', Integer(), default=0)
+    v.create(dataset, populate_default=True)
@@ -0,0 +1,14 @@
+from sqlalchemy import *
+from migrate import *
+
+meta = MetaData()
+
+def upgrade(migrate_engine):
+    meta.bind = migrate_engine
+    run = Table('run', meta, autoload=True)
+
+    run_entry = Table('run_entry', meta,
+        Column('run_id', Integer, ForeignKey('run.id'), index=True),
+        Column('entry_id', Unicode(42))
+        )
+    run_entry.create()
@@ -0,0 +1,12 @@
+from sqlalchemy import *
+from migrate import *
+
+meta = MetaData()
+
+def upgrade(migrate_engine):
+    meta.bind = migrate_engine
+    dataset = Table('dataset', meta, autoload=True)
+
+    # left empty, it is counted when first needed.
+    count = Column('entry_count', Integer())
+    count.create(dataset)
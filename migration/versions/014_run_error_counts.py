@@ -0,0 +1,17 @@
+from sqlalchemy import *
+from migrate import *
+
+meta = MetaData()
+
+def upgrade(migrate_engine):
+    meta.bind = migrate_engine
+    run = Table('run', meta, autoload=True)
+
+    num_errors = Column('num_errors', Integer())
+    num_errors.create(run)
+
+    failed_rows = Column('failed_rows', Integer())
+    failed_rows.create(run)
+
+    error_counts = Column('error_counts', Unicode)
+    error_counts.create(run)
@@ -0,0 +1,11 @@
+from sqlalchemy import *
+from migrate import *
+
+meta = MetaData()
+
+def upgrade(migrate_engine):
+    meta.bind = migrate_engine
+    run = Table('run', meta, autoload=True)
+
+    index_all = Column('index_all', Boolean(), default=False)
+    index_all.create(run)
@@ -34,6 +34,14 @@ def drop_dataset(name):
     db.session.commit()
     return 0
 
+def build_rollups(name):
+    dataset = Dataset.by_name(name)
+    if dataset is None:
+        log.warn("Dataset does not exist: '%s'", name)
+        return 1
+    dataset.build_rollups()
+    return 0
+
 def load_example(name):
     # TODO: separate the concepts of example/development data and test
     #       fixtures.
@@ -94,6 +102,9 @@ def _drop_collections(args):
 def _drop_dataset(args):
     return drop_dataset(args.name)
 
+def _build_rollups(args):
+    return build_rollups(args.name)
+
 def _load_example(args):
     return load_example(args.name)
 
@@ -119,6 +130,11 @@ def configure_parser(subparsers):
     p.add_argument('name')
     p.set_defaults(func=_drop_dataset)
 
+    p = sp.add_parser('rollups',
+                      help='Build the aggregate rollup tables of a dataset')
+    p.add_argument('name')
+    p.set_defaults(func=_build_rollups)
+
     p = sp.add_parser('loadexample',
                       help='Load an example dataset into the database')
     p.add_argument('name')
@@ -3,13 +3,13 @@ from __future__ import print_function
 import argparse
 import logging
 import sys
-import urllib2
 
 from openspending.lib import json
 
 from openspending.model import Source, Dataset, Account
 from openspending.model import meta as db
 from openspending.importer import CSVImporter
+from openspending.importer.util import open_source
 from openspending.validation.model import validate_model
 from openspending.validation.model import Invalid
 
@@ -30,6 +30,33 @@ import_parser.add_argument('--max-lines', action="store", dest='max_lines',
                            type=int, default=None, metavar='N',
                            help="Number of lines to import.")
 
+import_parser.add_argument('--batch-size', action="store", dest='batch_size',
+                           type=int, default=None, metavar='N',
+                           help="Bulk-load the data in batches of N rows.")
+
+import_parser.add_argument('--workers', action="store", dest='workers',
+                           type=int, default=None, metavar='N',
+                           help="Convert rows in N parallel processes.")
+
+import_parser.add_argument('--resume', action="store_true", dest='resume',
+                           default=False,
+                           help="Continue an interrupted import of the "
+                                "same source from its last checkpoint.")
+
+import_parser.add_argument('--rollups', action="store_true",
+                           dest='build_rollups', default=False,
+                           help="Build aggregate rollup tables after loading.")
+
+import_parser.add_argument('--max-errors', action="store", dest='max_errors',
+                           type=int, default=None, metavar='N',
+                           help="Abort the import after N errors.")
+
+import_parser.add_argument('--max-error-rate', action="store",
+                           dest='max_error_rate', type=float, default=None,
+                           metavar='RATE',
+                           help="Abort the import once more than RATE "
+                                "(e.g. 0.1) of the rows have errors.")
+
 import_parser.add_argument('--raise-on-error', action="store_true",
                            dest='raise_errors', default=False,
                            help='Get full traceback on first error.')
@@ -46,7 +73,11 @@ def shell_account():
 def csvimport(csv_data_url, args):
 
     def json_of_url(url):
-        return json.load(urllib2.urlopen(url))
+        reader = open_source(url)
+        try:
+            return json.load(reader)
+        finally:
+            reader.close()
 
     if not args.model:
         print("You must provide --model!",
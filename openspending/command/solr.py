@@ -1,7 +1,8 @@
 from openspending.lib import solr_util as solr
 
-def load(dataset):
-    solr.build_index(dataset)
+def load(dataset, batch_size=None, workers=None, senders=None):
+    solr.build_index(dataset, batch_size=batch_size, workers=workers,
+                     senders=senders)
     return 0
 
 def delete(dataset):
@@ -19,7 +20,8 @@ def clean():
     return 0
 
 def _load(args):
-    return load(args.dataset)
+    return load(args.dataset, batch_size=args.batch_size,
+                workers=args.workers, senders=args.senders)
 
 def _delete(args):
     return delete(args.dataset)
@@ -37,6 +39,15 @@ def configure_parser(subparsers):
 
     p = sp.add_parser('load', help='Load data for dataset into Solr')
     p.add_argument('dataset')
+    p.add_argument('--batch-size', action="store", dest='batch_size',
+                   type=int, default=None, metavar='N',
+                   help="Number of documents sent to Solr per request")
+    p.add_argument('--workers', action="store", dest='workers',
+                   type=int, default=None, metavar='N',
+                   help="Number of processes preparing documents")
+    p.add_argument('--senders', action="store", dest='senders',
+                   type=int, default=None, metavar='N',
+                   help="Number of concurrent requests to Solr")
     p.set_defaults(func=_load)
 
     p = sp.add_parser('delete', help='Delete data for dataset from Solr')
@@ -1,52 +1,181 @@
 import logging
 import traceback
+from time import time
 from datetime import datetime
+from collections import deque
+from itertools import islice
+
+from colander import SchemaNode, Mapping
 
 from openspending.model import Run, LogRecord
 from openspending.model import meta as db
 from openspending.validation.model import Invalid
-from openspending.validation.data import convert_types
+from openspending.validation.data import convert_types, InvalidData
 from openspending.lib import unicode_dict_reader as udr
+from openspending.lib.util import process_pool
 
 from openspending.importer import util
 
 log = logging.getLogger(__name__)
 
+# Number of source rows converted by an import worker at a time.
+CHUNK_SIZE = 500
+
+# Number of source rows after which the progress of an import is
+# committed, so that it can be resumed from there.
+CHECKPOINT_INTERVAL = 10000
+
+# Number of log records written to the database at a time.
+LOG_BATCH_SIZE = 100
+
+# Number of data errors logged individually for each attribute, column
+# and data type; further errors are only counted and summarized.
+MAX_ERROR_SAMPLES = 10
+
+# Number of source rows to read before ``max_error_rate`` is applied.
+ERROR_RATE_MIN_ROWS = 1000
+
+def _init_worker(mapping):
+    global _mapping
+    _mapping = mapping
+
+def _convert(mapping, line):
+    """ Convert a source row, returning a ``(data, error, traceback)``
+    tuple instead of raising validation or conversion errors. """
+    try:
+        return convert_types(mapping, line), None, None
+    except Exception as ex:
+        return None, ex, traceback.format_exc()
+
+def _convert_chunk(lines):
+    """ Convert a chunk of source rows in an import worker. Errors are
+    passed back in a form which can be pickled (see ``_load_error``). """
+    results = []
+    for line in lines:
+        data, error, tb = _convert(_mapping, line)
+        if isinstance(error, Invalid):
+            error = [(c.node.name, c.column, c.datatype, c.value, c.msg) \
+                     for c in error.children]
+        elif error is not None:
+            error = unicode(error)
+        results.append((data, error, tb))
+    return results
+
+def _load_error(error):
+    """ Re-create an error returned by ``_convert_chunk``. """
+    if isinstance(error, list):
+        invalid = Invalid(SchemaNode(Mapping(unknown='preserve')))
+        for args in error:
+            invalid.add(InvalidData(*args))
+        return invalid
+    return ValueError(error)
+
+def _results(async_result):
+    for data, error, tb in async_result.get():
+        if error is not None:
+            error = _load_error(error)
+        yield data, error, tb
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if len(chunk):
+        yield chunk
+
+
 class BaseImporter(object):
 
     def __init__(self, source):
         self.source = source
         self.dataset = source.dataset
         self.errors = 0
+        self.failed_rows = 0
         self.row_number = None
+        self.rows_per_second = None
+        self._batch = []
+        self._entry_ids = []
+        self._created = 0
+        self._error_counts = {}
+        self._records = []
 
     def run(self,
             dry_run=False,
             max_lines=None,
             raise_errors=False,
+            batch_size=None,
+            build_rollups=False,
+            workers=None,
+            resume=False,
+            max_errors=None,
+            max_error_rate=None,
             **kwargs):
 
         self.dry_run = dry_run
         self.raise_errors = raise_errors
+        self.batch_size = batch_size
         
-        before_count = len(self.dataset)
+        before_count = self.dataset.num_entries
 
         self.row_number = 0
+        if not dry_run:
+            self.dataset.preload()
+        begin = time()
 
-        self._run = Run('import', Run.STATUS_RUNNING,
-                        self.dataset, self.source)
-        db.session.add(self._run)
+        self._run = None
+        if resume and not dry_run:
+            self._run = Run.resumable('import', self.source)
+        if self._run is not None:
+            # continue after the last committed row of the earlier run,
+            # whose errors in the data loaded so far still count. Records
+            # logged after the checkpoint will be logged again.
+            self.row_number = self._run.checkpoint
+            self.errors = self._run.num_errors or 0
+            self.failed_rows = self._run.failed_rows or 0
+            self._error_counts = dict(((a, c, t), n) for a, c, t, n \
+                                      in self._run.error_counts or [])
+            self._run.records.filter(LogRecord.row > self.row_number).\
+                    delete(synchronize_session=False)
+            # entries created after the checkpoint were not counted.
+            before_count = self.dataset.count_entries()
+            self._run.status = Run.STATUS_RUNNING
+            self._run.time_end = None
+            log.info("Resuming run #%s after row %s", self._run.id,
+                     self.row_number)
+        else:
+            self._run = Run('import', Run.STATUS_RUNNING,
+                            self.dataset, self.source)
+            # indexing an initial load entry by entry would be slower
+            # than indexing the whole dataset.
+            self._run.index_all = before_count == 0
+            db.session.add(self._run)
         db.session.commit()
         log.info("Run reference: #%s", self._run.id)
+        start = self.row_number
 
         try:
-            for row_number, line in enumerate(self.lines, start=1):
-                if max_lines and row_number >= max_lines:
-                    break
-
+            lines = self.lines
+            if start or max_lines:
+                lines = islice(lines, start, max_lines - 1 if max_lines \
+                               else None)
+            converted = self.convert(lines, workers=workers)
+            for row_number, result in enumerate(converted, start=start+1):
                 self.row_number = row_number
-                self.process_line(line)
+                self.process_result(*result)
+                if row_number % CHECKPOINT_INTERVAL == 0:
+                    self.checkpoint()
+                if self.errors and self.exceeds_error_limit(max_errors,
+                        max_error_rate, row_number - start):
+                    self.log_exception(ValueError("Too many errors, the "
+                        "import was aborted."), error="%s errors in %s rows "
+                        "were found." % (self.errors, row_number - start))
+                    break
+            self.checkpoint()
         except Exception as ex:
+            self.flush_entry_count()
             self.log_exception(ex)
             if self.raise_errors:
                 self._run.status = Run.STATUS_FAILED
@@ -54,17 +183,35 @@ class BaseImporter(object):
                 db.session.commit()
                 raise
 
+        duration = time() - begin
+        if duration > 0:
+            self.rows_per_second = (self.row_number - start) / duration
+            log.info("Processed %s lines in %.2fs (%.1f rows/sec)",
+                     self.row_number - start, duration,
+                     self.rows_per_second)
+        for dimension in self.dataset.compounds:
+            log.debug("Key cache for %s: %r", dimension.name,
+                      dimension._pk_cache.stats())
+
         if self.row_number == 0:
             self.log_exception(ValueError("Didn't read any lines of data"), 
                     error='')
 
-        num_loaded = len(self.dataset) - before_count
-        if not self.errors and num_loaded < (self.row_number-1):
+        num_loaded = self.dataset.num_entries - before_count
+        if not self.errors and num_loaded < (self.row_number-start-1):
             self.log_exception(ValueError("The number of entries loaded is "
                 "smaller than the number of source rows read."),
                 error="%s rows were read, but only %s entries created. "
                     "Check the unique key criteria, entries seem to overlap." % \
-                    (self.row_number, num_loaded))
+                    (self.row_number-start, num_loaded))
+
+        self.log_error_summary()
+
+        if build_rollups and not dry_run:
+            try:
+                self.dataset.build_rollups()
+            except Exception as ex:
+                self.log_exception(ex)
 
         if self.errors:
             self._run.status = Run.STATUS_FAILED
@@ -78,27 +225,156 @@ class BaseImporter(object):
     def lines(self):
         raise NotImplementedError("lines not implemented in BaseImporter")
 
+    def convert(self, lines, workers=None):
+        """ Convert the source ``lines`` into the structure expected by
+        the dataset loader, yielding a ``(data, error, traceback)`` tuple
+        for each line in order.
+
+        With several ``workers``, the lines are converted in chunks by a
+        pool of processes, while reading the source and writing to the
+        database stay with the caller. Daemonic processes (such as task
+        workers) cannot have children, so they always convert inline
+        (see ``process_pool``).
+        """
+        mapping = self.dataset.mapping
+        pool = process_pool(workers, _init_worker, (mapping,))
+        if pool is None:
+            for line in lines:
+                yield _convert(mapping, line)
+            return
+
+        pending = deque()
+        try:
+            for chunk in _chunks(lines, CHUNK_SIZE):
+                pending.append(pool.apply_async(_convert_chunk, (chunk,)))
+                # keep a bounded number of chunks in flight:
+                if len(pending) >= workers * 2:
+                    for result in _results(pending.popleft()):
+                        yield result
+            while pending:
+                for result in _results(pending.popleft()):
+                    yield result
+        finally:
+            pool.terminate()
+            pool.join()
+
     def process_line(self, line):
+        self.process_result(*_convert(self.dataset.mapping, line))
+
+    def process_result(self, data, error=None, tb=None):
+        """ Load a converted row or log the error encountered while
+        converting it. """
         if self.row_number % 1000 == 0:
             log.info('Imported %s lines' % self.row_number)
 
+        if error is None and self.batch_size and not self.dry_run:
+            self._batch.append((self.row_number, data))
+            if len(self._batch) >= self.batch_size:
+                self.flush_batch()
+        else:
+            self.load_row(data, error, tb)
+
+    def load_row(self, data, error=None, tb=None):
+        """ Load a single converted row right away, or log the error
+        encountered while converting or loading it. """
         try:
-            data = convert_types(self.dataset.mapping, line)
-            if not self.dry_run:
-                self.dataset.load(data)
+            if error is not None:
+                raise error
+            if self.dry_run:
+                return
+            entry_id, created = self.dataset.load(data)
+            self._entry_ids.append(entry_id)
+            self._created += created
         except Invalid as invalid:
+            self.failed_rows += 1
             for child in invalid.children:
                 self.log_invalid_data(child)
             if self.raise_errors:
                 raise
         except Exception as ex:
-            self.log_exception(ex)
+            self.failed_rows += 1
+            self.log_exception(ex, error=tb)
             if self.raise_errors:
                 raise
 
+    def exceeds_error_limit(self, max_errors, max_error_rate, rows):
+        """ Check whether the import should be aborted since more than
+        ``max_errors`` errors were found, or since the share of failed
+        rows among the ``rows`` read exceeds ``max_error_rate``. """
+        if max_errors is not None and self.errors > max_errors:
+            return True
+        if max_error_rate is not None and rows >= ERROR_RATE_MIN_ROWS:
+            return self.failed_rows > max_error_rate * rows
+        return False
+
+    def flush_batch(self):
+        """ Write all rows buffered in bulk-load mode to the dataset. If
+        the batch cannot be loaded, its rows are loaded one by one, so
+        that only the failing rows are logged (with their row number)
+        and all others are kept. """
+        if not len(self._batch):
+            return
+        batch, self._batch = self._batch, []
+        try:
+            entry_ids, created = self.dataset.load_batch(
+                [data for row_number, data in batch])
+            self._entry_ids.extend(entry_ids)
+            self._created += created
+        except Exception as ex:
+            log.warn("Cannot load a batch of rows, loading them one by "
+                     "one: %s", ex)
+            current = self.row_number
+            try:
+                for row_number, data in batch:
+                    self.row_number = row_number
+                    self.load_row(data)
+            finally:
+                self.row_number = current
+        self.flush_entry_count()
+
+    def flush_entry_count(self):
+        """ Add the entries created since the last call to the entry
+        count of the dataset. """
+        created, self._created = self._created, 0
+        self.dataset.add_entries(created)
+
+    def checkpoint(self):
+        """ Write all buffered rows and record the current row and the
+        error counters on the run, so that an interrupted import can be
+        resumed from here. The key caches of the dimensions are not kept,
+        as ``preload`` warms them up from the dimension tables again. """
+        if self.dry_run:
+            return
+        self.flush_batch()
+        self.flush_entry_count()
+        self.record_entries()
+        self._run.checkpoint = self.row_number
+        self._run.num_errors = self.errors
+        self._run.failed_rows = self.failed_rows
+        self._run.error_counts = [list(k) + [n] for k, n \
+                                  in sorted(self._error_counts.items())]
+        self.flush_log()
+
+    def record_entries(self):
+        """ Store the ids of the entries loaded so far on the run, for
+        incremental indexing (unless all entries will be indexed). """
+        entry_ids, self._entry_ids = self._entry_ids, []
+        if not self._run.index_all:
+            self._run.record_entries(entry_ids)
+
+    @property
+    def run_id(self):
+        return self._run.id
+
     def log_invalid_data(self, invalid):
-        log_record = LogRecord(self._run, LogRecord.CATEGORY_DATA,
-                               logging.ERROR, invalid.msg)
+        key = (invalid.node.name, invalid.column, invalid.datatype)
+        count = self._error_counts.get(key, 0) + 1
+        self._error_counts[key] = count
+        if count > MAX_ERROR_SAMPLES:
+            self.errors += 1
+            return
+
+        log_record = self._record(LogRecord.CATEGORY_DATA, invalid.msg)
         log_record.attribute = invalid.node.name
         log_record.column = invalid.column
         log_record.value = invalid.value
@@ -112,19 +388,54 @@ class BaseImporter(object):
         self._log(log_record)
 
     def log_exception(self, exception, error=None):
-        log_record = LogRecord(self._run, LogRecord.CATEGORY_SYSTEM,
-                               logging.ERROR, str(exception))
+        log_record = self._record(LogRecord.CATEGORY_SYSTEM,
+                                  str(exception))
         if error is not None:
             log_record.error = error
         else:
             log_record.error = traceback.format_exc()
         log.error(unicode(exception))
         self._log(log_record)
+        self.flush_log()
+
+    def log_error_summary(self):
+        """ Log the number of data errors of each attribute, column and
+        data type for which not all errors were logged individually. """
+        for key, count in sorted(self._error_counts.items()):
+            if count <= MAX_ERROR_SAMPLES:
+                continue
+            attribute, column, datatype = key
+            msg = "'%s' (%s) could not be generated from column '%s' " \
+                  "in %s rows, only the first %s are listed."
+            msg = msg % (attribute, datatype, column, count,
+                         MAX_ERROR_SAMPLES)
+            log_record = self._record(LogRecord.CATEGORY_DATA, msg)
+            log_record.attribute = attribute
+            log_record.column = column
+            log_record.data_type = datatype
+            log.warn(msg)
+            self._records.append(log_record)
+        self.flush_log()
+
+    def _record(self, category, message):
+        # only the key of the run is set, so that the record is not added
+        # to the session (through the backref) before ``flush_log``.
+        log_record = LogRecord(None, category, logging.ERROR, message)
+        log_record.run_id = self._run.id
+        return log_record
 
     def _log(self, log_record):
         self.errors += 1
         log_record.row = self.row_number
-        db.session.add(log_record)
+        self._records.append(log_record)
+        if len(self._records) >= LOG_BATCH_SIZE:
+            self.flush_log()
+
+    def flush_log(self):
+        """ Write the buffered log records (and all other pending
+        changes) to the database in one transaction. """
+        records, self._records = self._records, []
+        db.session.add_all(records)
         db.session.commit()
 
 
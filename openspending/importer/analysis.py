@@ -1,10 +1,10 @@
 from collections import defaultdict
-from urllib import urlopen
 import logging
 
 from messytables import CSVRowSet, type_guess
 from messytables.types import TYPES, DateType
 from openspending.lib.util import slugify
+from openspending.importer.util import open_source
 
 log = logging.getLogger(__name__)
 
@@ -27,8 +27,9 @@ def frequent_values(sample):
     return sorted_values
 
 def analyze_csv(url, sample=1000):
+    fileobj = None
     try:
-        fileobj = urlopen(url)
+        fileobj = open_source(url)
         row_set = CSVRowSet('data', fileobj, window=sample)
         sample = list(row_set.sample)
         headers, sample = sample[0], sample[1:]
@@ -56,4 +57,7 @@ def analyze_csv(url, sample=1000):
                 'mapping': mapping}
     except Exception, e:
         return {'error': unicode(e)}
+    finally:
+        if fileobj is not None:
+            fileobj.close()
 
@@ -1,4 +1,9 @@
-from urllib import urlopen
+import os
+import bz2
+import zlib
+import mmap
+from urllib import urlopen, url2pathname
+from urlparse import urlparse
 
 # Created by Scott David Daniels on Wed, 23 Jun 2004, licensed under the PSF
 # http://code.activestate.com/recipes/286165-ilines-universal-newlines-from-any-data-source/
@@ -64,8 +69,179 @@ def ilines(source_iterable):
     if tail:
         yield tail
 
-def urlopen_lines(url):
-    """Yield lines from a URL"""
-    return ilines(urlopen(url))
+# Size (in bytes) of the blocks read from a source.
+BLOCK_SIZE = 64 * 1024
+
+# Size (in bytes) of the blocks taken from a memory-mapped file.
+MMAP_BLOCK_SIZE = 1024 * 1024
+
+# Compression formats, by file extension.
+COMPRESSIONS = {'.gz': 'gzip', '.gzip': 'gzip', '.bz2': 'bz2'}
+
+def iblocks(fh, size=BLOCK_SIZE):
+    """Yield blocks of ``size`` bytes from a file-like object"""
+    while True:
+        block = fh.read(size)
+        if not block:
+            break
+        yield block
+
+
+class SourceReader(object):
+    """ A file-like object to read the data of an import source.
+    Iterating over a reader yields blocks of data rather than lines;
+    these can be split into lines with ``ilines``. """
+
+    block_size = BLOCK_SIZE
+
+    def read(self, size=-1):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+    def __iter__(self):
+        return iblocks(self, self.block_size)
+
+
+class FileReader(SourceReader):
+    """ Read a local file through a memory map, so that blocks are
+    copied straight from the page cache. Empty files cannot be mapped
+    and are read as regular files. """
+
+    block_size = MMAP_BLOCK_SIZE
+
+    def __init__(self, path):
+        self.fh = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self.fh.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except (ValueError, mmap.error):
+            self.data = self.fh
+
+    def read(self, size=-1):
+        return self.data.read(size)
+
+    def close(self):
+        if self.data is not self.fh:
+            self.data.close()
+        self.fh.close()
 
 
+class HTTPReader(SourceReader):
+    """ Read a remote source (e.g. over HTTP or FTP) from the buffered
+    response of ``urlopen``. """
+
+    def __init__(self, url):
+        self.fh = urlopen(url)
+
+    def read(self, size=-1):
+        return self.fh.read(size)
+
+    def close(self):
+        self.fh.close()
+
+
+class DecompressingReader(SourceReader):
+    """ Transparently decompress the data of another reader, which is
+    either ``gzip`` or ``bz2`` compressed. Files made of several
+    compressed streams (e.g. concatenated with ``cat``) are read as a
+    whole. At most ``block_size`` bytes of ``gzip`` data are inflated at
+    a time; ``bz2`` cannot be limited that way and is decompressed one
+    block of the underlying reader at a time. """
+
+    def __init__(self, reader, compression):
+        self.reader = reader
+        self.compression = compression
+        self.decompressor = self._decompressor()
+        self.source = iter(reader)
+        # compressed data which has not been decompressed yet:
+        self.input = ''
+        # decompressed data, of which the first ``offset`` bytes have
+        # been read already:
+        self.buffer = ''
+        self.offset = 0
+
+    def _decompressor(self):
+        if self.compression == 'gzip':
+            # 16 makes zlib expect a gzip header and trailer.
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        return bz2.BZ2Decompressor()
+
+    def _decompress(self):
+        if self.compression == 'gzip':
+            data = self.decompressor.decompress(self.input, self.block_size)
+            self.input = self.decompressor.unconsumed_tail
+        else:
+            try:
+                data = self.decompressor.decompress(self.input)
+            except EOFError:
+                # the previous stream ended with the previous block.
+                self.decompressor = self._decompressor()
+                return ''
+            self.input = ''
+        if self.decompressor.unused_data:
+            # the data following the end of a stream starts another one.
+            self.input = self.decompressor.unused_data
+            self.decompressor = self._decompressor()
+        return data
+
+    def _inflate(self):
+        """ Return the next piece of decompressed data, or an empty
+        string at the end of the source. """
+        while True:
+            if not self.input:
+                try:
+                    self.input = self.source.next()
+                except StopIteration:
+                    if self.compression == 'gzip':
+                        return self.decompressor.flush()
+                    return ''
+            data = self._decompress()
+            if data:
+                return data
+
+    def read(self, size=-1):
+        chunks = []
+        while size != 0:
+            if self.offset >= len(self.buffer):
+                self.buffer, self.offset = self._inflate(), 0
+                if not self.buffer:
+                    break
+            end = len(self.buffer) if size < 0 else self.offset + size
+            chunk = self.buffer[self.offset:end]
+            self.offset += len(chunk)
+            if size > 0:
+                size -= len(chunk)
+            chunks.append(chunk)
+        return ''.join(chunks)
+
+    def close(self):
+        self.reader.close()
+
+
+def open_source(url):
+    """ Open the import source at ``url``, picking the fastest reader
+    for the URL scheme: local paths and ``file://`` URLs are memory-mapped,
+    other URLs are read through ``urlopen``. Sources ending in ``.gz`` or
+    ``.bz2`` are decompressed on the fly. """
+    parsed = urlparse(url)
+    if parsed.scheme == 'file':
+        reader = FileReader(url2pathname(parsed.path))
+    elif not parsed.scheme:
+        reader = FileReader(url)
+    else:
+        reader = HTTPReader(url)
+    extension = os.path.splitext(parsed.path)[1].lower()
+    if extension in COMPRESSIONS:
+        reader = DecompressingReader(reader, COMPRESSIONS[extension])
+    return reader
+
+def urlopen_lines(url):
+    """Yield lines from a URL"""
+    reader = open_source(url)
+    try:
+        for line in ilines(reader):
+            yield line
+    finally:
+        reader.close()
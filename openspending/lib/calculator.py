@@ -1,4 +1,5 @@
 import csv
+from bisect import bisect_right
 from StringIO import StringIO
 
 # National statistics for tax paid per household income decile, 2008/9.
@@ -24,6 +25,79 @@ income_table = list(reader)
 income_table = [[(float(income)) for income in row] for row in income_table]
 
 class TaxCalculator2010(object):
+    """ Estimates tax contributions by interpolating ``income_table``.
+    The break points, slopes and top rates of each kind of tax are
+    computed once, so that each income can be looked up by bisection;
+    use ``total_taxes()`` to calculate many incomes at once. """
+
+    # The kinds of tax in rows 2 to 7 of the income table.
+    TAXES = ['total_direct_tax', 'other_indirect_tax', 'vat', 'tobacco_tax',
+             'alcohol_tax', 'car_related_tax']
+
+    def __init__(self, table=income_table):
+        self.incomes = table[1]
+        self.taxes = table[2:]
+        self.slopes = []
+        for row in self.taxes:
+            self.slopes.append([0.0] + [
+                (row[i] - row[i-1]) / (self.incomes[i] - self.incomes[i-1])
+                for i in range(1, len(row))])
+        self.top_rates = [row[-1] / self.incomes[-1] for row in self.taxes]
+
+    def _band(self, income):
+        """ Index of the first decile above ``income``, or ``None`` if it
+        is above all deciles. """
+        i = bisect_right(self.incomes, income)
+        if i < len(self.incomes):
+            return i
+
+    def _estimate(self, income, is_smoker, is_drinker, is_driver):
+        i = self._band(income)
+        if i is None:
+            values = [income * rate for rate in self.top_rates]
+        else:
+            offset = income - self.incomes[i-1]
+            values = [row[i-1] + slopes[i] * offset for row, slopes in \
+                      zip(self.taxes, self.slopes)]
+        tax_results = dict(zip(self.TAXES, values))
+        if not is_smoker:
+            tax_results['tobacco_tax'] = 0
+        if not is_drinker:
+            tax_results['alcohol_tax'] = 0
+        if not is_driver:
+            tax_results['car_related_tax'] = 0
+
+        # Calculate indirect tax by adding up all the other kinds of tax.
+        tax_results['total_indirect_tax'] = \
+            tax_results.pop('other_indirect_tax') + tax_results['vat'] + \
+            tax_results['tobacco_tax'] + tax_results['alcohol_tax'] + \
+            tax_results['car_related_tax']
+        tax_results['tax'] = tax_results['total_direct_tax'] + \
+            tax_results['total_indirect_tax']
+        return tax_results
+
+    def total_taxes(self,
+          incomes,
+          is_smoker=True,
+          is_drinker=True,
+          is_driver=True,
+        ):
+        '''Estimates the tax contributions for a sequence of household
+        incomes, e.g. to plot them over a distribution of incomes. See
+        ``total_tax`` for the parameters.
+
+        :returns: a list with a dictionary of tax results for each income.
+        '''
+        results = []
+        for income in incomes:
+            income = float(income)
+            if income <= 0.0:
+                results.append({'tax': 0.0})
+            else:
+                results.append(self._estimate(income, is_smoker,
+                                              is_drinker, is_driver))
+        return results
+
     def total_tax(self, 
           income, 
           spending=None,
@@ -48,20 +122,20 @@ class TaxCalculator2010(object):
         :returns: a pair `(total_tax, explanation)`. The `explanation` is a list of
             strings describing the steps of the calculation.
         '''
-        lower = 0.0
         income = float(income)
         explanation = []
-        tax_results = {}
         if income <= 0.0:
-            tax_results['tax'] = 0.0
             explanation.append('Incomes must be positive.')
-            return tax_results, explanation    
+            return {'tax': 0.0}, explanation
 
-        # First, find the relevant income deciles.     
-        for i, upper in enumerate(income_table[1]):
-            if income < upper:
-                # Found the right band. Use linear interpolation.
-                explanation.append('''\
+        i = self._band(income)
+        if i is None:
+            explanation.append('''\
+For very high-earning households, in the top income decile, we don't use linear interpolation,
+but assume the fractions of income paid as tax are the average for the top decile.''')
+        else:
+            direct, other, vat, tobacco, alcohol, car = self.taxes
+            explanation.append('''\
 This household income falls between national average income decile %s (which has average \
 gross household income of %.2f, and pays %.2f in direct tax, %.2f in VAT, \
 %.2f in smoking taxes, %.2f in alcohol-related taxes, %.2f in car-related taxes, \
@@ -69,77 +143,22 @@ and %.2f in other indirect taxes), and decile %s (which has average gross \
 household income of %.2f, and pays %.2f in direct tax, %.2f in VAT, \
 %.2f in smoking taxes, %.2f in alcohol-related taxes, %.2f in car-related taxes, \
 and %.2f in other indirect taxes).''' \
-                % (i-1, lower, income_table[2][i-1], income_table[3][i-1], income_table[4][i-1],
-                   income_table[5][i-1], income_table[6][i-1], income_table[7][i-1], 
-                   i, upper, income_table[2][i], income_table[3][i], income_table[4][i],
-                   income_table[5][i], income_table[6][i], income_table[7][i]))
-                # Linear interpolation.
-                multiplier = (income-lower) / (upper-lower)
-                tax_results['total_direct_tax'] = income_table[2][i-1] + \
-                       (income_table[2][i] - income_table[2][i-1]) * multiplier
-                indirect_tax_minus_extras = income_table[3][i-1] + \
-                       (income_table[3][i] - income_table[3][i-1]) * multiplier
-                tax_results['vat'] = income_table[4][i-1] + \
-	                       (income_table[4][i] - income_table[4][i-1]) * multiplier
-                if is_smoker:
-                    tax_results['tobacco_tax'] = income_table[5][i-1] + \
-	                       (income_table[5][i] - income_table[5][i-1]) * multiplier
-                else: 
-                    tax_results['tobacco_tax'] = 0
-                if is_drinker:
-                    tax_results['alcohol_tax'] = income_table[6][i-1] + \
-	                       (income_table[6][i] - income_table[6][i-1]) * multiplier
-                else: 
-                    tax_results['alcohol_tax'] = 0
-                if is_driver:
-                    tax_results['car_related_tax'] = income_table[7][i-1] + \
-	                       (income_table[7][i] - income_table[7][i-1]) * multiplier
-                else: 
-                    tax_results['car_related_tax'] = 0
-                break
-            else:
-                lower = upper
-        else:
-            # Income is above all the bands. Use constant tax rates.
-            direct_top_rate = income_table[2][-1] / income_table[1][-1]
-            indirect_top_rate = income_table[3][-1] / income_table[1][-1]
-            vat_top_rate = income_table[4][-1] / income_table[1][-1]
-            tax_results['total_direct_tax'] = income * direct_top_rate
-            indirect_tax_minus_extras = income * indirect_top_rate
-            tax_results['vat'] = income * vat_top_rate
-            if is_smoker:
-                tax_results['tobacco_tax'] = income * (income_table[5][-1] / income_table[1][-1])
-            else: 
-                tax_results['tobacco_tax'] = 0
-            if is_drinker:
-                tax_results['alcohol_tax'] = income * (income_table[6][-1] / income_table[1][-1]) 
-            else: 
-                tax_results['alcohol_tax'] = 0
-            if is_drinker:
-                tax_results['car_related_tax'] = income * (income_table[7][-1] / income_table[1][-1])
-            else: 
-                tax_results['car_related_tax'] = 0
-            explanation.append('''\
-For very high-earning households, in the top income decile, we don't use linear interpolation,
-but assume the fractions of income paid as tax are the average for the top decile.''')
-
-        # Calculate indirect tax by adding up all the other kinds of tax.
-        tax_results['total_indirect_tax'] = indirect_tax_minus_extras \
-          + tax_results['vat'] + tax_results['tobacco_tax'] + \
-          + tax_results['alcohol_tax'] + tax_results['car_related_tax']
+                % (i-1, self.incomes[i-1], direct[i-1], other[i-1], vat[i-1],
+                   tobacco[i-1], alcohol[i-1], car[i-1],
+                   i, self.incomes[i], direct[i], other[i], vat[i],
+                   tobacco[i], alcohol[i], car[i]))
+        tax_results = self._estimate(income, is_smoker, is_drinker, is_driver)
 
         # Set up the explanation text. 
         explanation_text = 'Therefore, a'
         if not is_smoker:
             explanation_text += ' non-smoking'
         if not is_drinker:
-            explanation_text += ' non-driving'
+            explanation_text += ' non-drinking'
         if not is_driver:
             explanation_text += ' non-driving'
         explanation_text += ' household with an income of %.2f pays approximately %.2f in direct tax and %.2f in total indirect tax.' % \
             (income, tax_results['total_direct_tax'], tax_results['total_indirect_tax'])
         explanation.append(explanation_text)
 
-        tax_results['tax'] = tax_results['total_direct_tax'] + tax_results['total_indirect_tax']
-
-        return tax_results, explanation
\ No newline at end of file
+        return tax_results, explanation
@@ -3,31 +3,59 @@ import csv
 from datetime import datetime
 from StringIO import StringIO
 
+from openspending.model import CompoundDimension
 from openspending.lib.util import flatten
 
-def write_csv(entries, response):
-    response.content_type = 'text/csv'
-    return generate_csv(entries)
+# Size (in bytes) of the chunks yielded by ``generate_csv``.
+CHUNK_SIZE = 64 * 1024
 
-def generate_csv(entries):
-    generate_headers = True
-    for entry in entries:
-        row = {}
-        for k, v in flatten(entry).items():
-            if isinstance(v, (list, tuple, dict)):
-                continue
-            elif isinstance(v, datetime):
-                v = v.isoformat()
-            row[unicode(k).encode('utf8')] = unicode(v).encode('utf8')
+def write_csv(entries, response, fields=None):
+    response.content_type = 'text/csv'
+    return generate_csv(entries, fields=fields)
 
-        fields = sorted(row.keys())
-        sio = StringIO()
-        writer = csv.DictWriter(sio, fields)
+def entry_fields(dataset):
+    """ The column names of the flattened entries of ``dataset``, as
+    returned by ``Dataset.entries()``. """
+    fields = ['id']
+    for field in dataset.fields:
+        if isinstance(field, CompoundDimension):
+            fields.append(field.name + '.id')
+            fields.append(field.name + '.taxonomy')
+            for attr in field.attributes:
+                fields.append(field.name + '.' + attr.name)
+        else:
+            fields.append(field.name)
+    return sorted(fields)
 
-        if generate_headers:
-            header = dict(zip(fields, fields))
-            writer.writerow(header)
-            generate_headers = False
+def _row(entry):
+    row = {}
+    for k, v in flatten(entry).iteritems():
+        if isinstance(v, (list, tuple, dict)):
+            continue
+        elif isinstance(v, datetime):
+            v = v.isoformat()
+        row[unicode(k).encode('utf8')] = unicode(v).encode('utf8')
+    return row
 
+def generate_csv(entries, fields=None):
+    """ Generate CSV data for ``entries`` in chunks of about
+    ``CHUNK_SIZE`` bytes. The header consists of ``fields`` (e.g. from
+    ``entry_fields()``) or, if not given, of the columns of the first
+    entry; other columns are left out. """
+    sio = StringIO()
+    writer = None
+    for entry in entries:
+        row = _row(entry)
+        if writer is None:
+            if fields is None:
+                fields = sorted(row.keys())
+            fields = [unicode(f).encode('utf8') for f in fields]
+            writer = csv.DictWriter(sio, fields, extrasaction='ignore')
+            writer.writerow(dict(zip(fields, fields)))
         writer.writerow(row)
+        if sio.tell() >= CHUNK_SIZE:
+            yield sio.getvalue()
+            sio.seek(0)
+            sio.truncate()
+    if sio.tell():
         yield sio.getvalue()
@@ -2,6 +2,7 @@ from datetime import datetime
 import logging
 
 from decorator import decorator
+from paste.deploy.converters import asbool
 
 from pylons import request, response
 
@@ -9,6 +10,9 @@ from openspending.lib import json
 
 log = logging.getLogger(__name__)
 
+# Size (in bytes) of the chunks yielded by ``generate_browser_json``.
+CHUNK_SIZE = 64 * 1024
+
 
 def default_json(obj):
     '''\
@@ -22,6 +26,15 @@ def default_json(obj):
         return obj.isoformat()
     raise TypeError("%r is not JSON serializable" % obj)
 
+def pretty_indent():
+    """ The indentation of JSON output: compact unless the request asks
+    for ``pretty`` output. """
+    try:
+        pretty = asbool(request.params.get('pretty', False))
+    except ValueError:
+        pretty = False
+    return 2 if pretty else None
+
 def write_browser_json(entries, stats, facets, response):
     """ Streaming support for large result sets, specific to the browser as
     the data is enveloped. """
@@ -30,31 +43,41 @@ def write_browser_json(entries, stats, facets, response):
     if 'callback' in request.params:
         response.content_type = 'text/javascript'
         callback = str(request.params['callback'])
-    return generate_browser_json(entries, stats, facets, callback)
-
-def generate_browser_json(entries, stats, facets, callback):
-    yield callback + '({' if callback else '{'
-    yield '"stats": %s, "facets": %s, "results": [' % (
-            to_json(stats), to_json(facets))
-    iter = entries.__iter__()
-    has_next, first = True, True
-    while has_next:
-        try:
-            row = iter.next()
-        except StopIteration:
-            has_next = False
-        if has_next:
-            if not first:
-                yield ', '
-            yield to_json(row)
+    return generate_browser_json(entries, stats, facets, callback,
+                                 indent=pretty_indent())
+
+def generate_browser_json(entries, stats, facets, callback, indent=None):
+    """ Generate the enveloped JSON for ``entries``, joining rows into
+    chunks of about ``CHUNK_SIZE`` bytes. """
+    sep = ', ' if indent else ','
+    colon = ': ' if indent else ':'
+    chunk = [callback + '({' if callback else '{',
+             '"stats"%s%s%s"facets"%s%s%s"results"%s[' % (
+             colon, to_json(stats, indent), sep,
+             colon, to_json(facets, indent), sep, colon)]
+    size, first = 0, True
+    for row in entries:
+        data = to_json(row, indent)
+        if not first:
+            chunk.append(sep)
+        chunk.append(data)
+        size += len(data)
         first = False
-    yield ']})' if callback else ']}'
+        if size >= CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    chunk.append(']})' if callback else ']}')
+    yield ''.join(chunk)
 
-def to_json(data):
-    return json.dumps(data, default=default_json, indent=2)
+def to_json(data, indent=None):
+    """ Serialize ``data`` as JSON, without any whitespace unless it is
+    indented. """
+    separators = (',', ':') if indent is None else None
+    return json.dumps(data, default=default_json, indent=indent,
+                      separators=separators)
 
 def to_jsonp(data):
-    result = to_json(data)
+    result = to_json(data, pretty_indent())
     if 'callback' in request.params:
         response.headers['Content-Type'] = 'text/javascript'
         log.debug("Returning JSONP wrapped action output")
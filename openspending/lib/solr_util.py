@@ -5,12 +5,16 @@ Helper methods for using Solr.
 import datetime
 import logging
 import json
+import multiprocessing
+from collections import deque, namedtuple
+from Queue import Queue
+from threading import Thread
 from unicodedata import category
 
 from solr import SolrConnection, SolrException
 
 from openspending import model
-from openspending.lib.util import flatten
+from openspending.lib.util import flatten, process_pool
 from openspending.plugins.core import PluginImplementations
 from openspending.plugins.interfaces import ISolrSearch
 
@@ -20,12 +24,21 @@ url = 'http://localhost:8983/solr'
 http_user = None
 http_pass = None
 
+# Indexing pipeline: documents per request, number of processes
+# transforming entries (None: one per CPU) and of concurrent senders.
+index_batch_size = 1000
+index_workers = None
+index_senders = 2
+
 _client = None
 
 def configure(config=None):
     global url
     global http_user
     global http_pass
+    global index_batch_size
+    global index_workers
+    global index_senders
 
     if not config:
         config = {}
@@ -33,6 +46,14 @@ def configure(config=None):
     url = config.get('openspending.solr.url', url)
     http_user = config.get('openspending.solr.http_user', http_user)
     http_pass = config.get('openspending.solr.http_pass', http_pass)
+    index_batch_size = int(config.get('openspending.solr.index_batch_size',
+                                      index_batch_size))
+    index_workers = config.get('openspending.solr.index_workers',
+                               index_workers)
+    if index_workers is not None:
+        index_workers = int(index_workers)
+    index_senders = int(config.get('openspending.solr.index_senders',
+                                   index_senders))
 
 # Solr connection singleton
 _solr = None
@@ -47,12 +68,18 @@ def get_connection():
     if url == 'stub':
         _solr = _Stub()
     else:
-        _solr = SolrConnection(url,
-                               http_user=http_user,
-                               http_pass=http_pass)
+        _solr = _connect()
 
     return _solr
 
+def _connect():
+    """Create a new Solr connection, e.g. for use in another thread."""
+    if url == 'stub':
+        return get_connection()
+    return SolrConnection(url,
+                          http_user=http_user,
+                          http_pass=http_pass)
+
 
 # TODO: this should move in openspending.ui/tests/stub/solr.py or the like
 class _Stub(object):
@@ -68,7 +95,7 @@ class _Stub(object):
         self.records.append(kwargs)
 
     def add_many(self, records):
-        self.records = self.records + records
+        self.records.extend(records)
 
     def commit(self):
         pass
@@ -80,6 +107,10 @@ class _Stub(object):
         self.records = []
         pass
 
+    def delete_many(self, ids):
+        ids = set(ids)
+        self.records = [r for r in self.records if r.get('_id') not in ids]
+
     def query(self, q, **kwargs):
         if q == '*' or q == '':
             self.results = self.records
@@ -163,18 +194,147 @@ def optimize():
     solr.optimize()
     solr.commit()
 
-def build_index(dataset_name):
-    solr = get_connection()
+# The parts of a dataset needed by ``extend_entry``, which can be
+# passed to worker processes.
+DatasetRef = namedtuple('DatasetRef', ['name', 'id'])
+
+def _extend_entries(args):
+    dataset, entries = args
+    return [extend_entry(entry, dataset) for entry in entries]
+
+def _send(queue, errors):
+    """Post the batches of documents in ``queue`` to Solr until a
+    ``None`` is received."""
+    solr = _connect()
+    while True:
+        docs = queue.get()
+        if docs is None:
+            break
+        if errors:
+            # keep draining the queue, the indexer is giving up.
+            continue
+        try:
+            solr.add_many(docs)
+        except Exception, e:
+            log.exception(e)
+            errors.append(e)
+
+def build_index(dataset_name, batch_size=None, workers=None, senders=None):
+    """Index all entries of a dataset. The entries are read from the
+    database in the calling thread, converted into Solr documents by a
+    pool of ``workers`` processes and posted in batches of
+    ``batch_size`` documents by ``senders`` concurrent threads. The
+    index is committed once all documents have been sent."""
     dataset_ = model.Dataset.by_name(dataset_name)
     assert dataset_ is not None, "No such dataset: %s" % dataset_name
-    buf = []
-    for i, entry in enumerate(dataset_.entries()):
-        ourdata = extend_entry(entry, dataset_)
-        buf.append(ourdata)
-        if i and i % 1000 == 0:
-            solr.add_many(buf)
-            solr.commit()
-            log.info("Indexed %d entries", i)
-            buf = []
-    solr.add_many(buf)
+    num = _index(dataset_, dataset_.entries(), batch_size=batch_size,
+                 workers=workers, senders=senders)
+    get_connection().commit()
+    log.info("Indexed %d entries of: %s", num, dataset_name)
+
+def update_index(dataset_name, entry_ids, batch_size=None, workers=None,
+                 senders=None):
+    """Re-index only the entries with the given ids, e.g. those changed
+    by an import run. Entries which no longer exist are removed from
+    the index."""
+    dataset_ = model.Dataset.by_name(dataset_name)
+    assert dataset_ is not None, "No such dataset: %s" % dataset_name
+    batch_size = batch_size or index_batch_size
+    missing = set()
+
+    def entries():
+        for ids in _batches(entry_ids, 500):
+            ids = set(ids)
+            column = dataset_.alias.c.id
+            for entry in dataset_.entries(column.in_(list(ids))):
+                ids.discard(entry['id'])
+                yield entry
+            missing.update(ids)
+
+    num = _index(dataset_, entries(), batch_size=batch_size,
+                 workers=workers, senders=senders)
+    solr = get_connection()
+    for ids in _batches(missing, batch_size):
+        solr.delete_many([dataset_.name + '::' + i for i in ids])
     solr.commit()
+    log.info("Indexed %d changed and removed %d entries of: %s", num,
+             len(missing), dataset_name)
+
+# Share of the entries of a dataset which an import run may change
+# before the whole dataset is re-indexed rather than the changed ones.
+INDEX_ALL_SHARE = 0.5
+
+def index_run(run):
+    """Update the index after an import run: re-index the entries it
+    recorded as changed, or the whole dataset if the run loaded into an
+    empty dataset or changed most of its entries. Looking up entries by
+    their ids is much slower per entry than reading them all."""
+    dataset_ = run.dataset
+    if run.index_all or \
+            run.count_entries() > dataset_.num_entries * INDEX_ALL_SHARE:
+        build_index(dataset_.name)
+    else:
+        update_index(dataset_.name, run.entry_ids())
+    run.clear_entries()
+
+def _index(dataset_, entries, batch_size=None, workers=None, senders=None):
+    """Run the indexing pipeline for the given ``entries`` of a dataset
+    and return their number. The index is not committed."""
+    batch_size = batch_size or index_batch_size
+    workers = workers or index_workers or multiprocessing.cpu_count()
+    senders = senders or index_senders
+    dataset = DatasetRef(dataset_.name, dataset_.id)
+
+    pool = process_pool(workers)
+
+    queue, errors = Queue(maxsize=senders * 2), []
+    threads = [Thread(target=_send, args=(queue, errors))
+               for i in range(senders)]
+    for thread in threads:
+        thread.start()
+
+    # Transformed batches are handed to the senders in order; at most
+    # two batches per worker are pending, which bounds memory use.
+    pending = deque()
+    num = 0
+    try:
+        for batch in _batches(entries, batch_size):
+            if errors:
+                break
+            if pool is None:
+                queue.put(_extend_entries((dataset, batch)))
+            else:
+                pending.append(pool.apply_async(_extend_entries,
+                                                ((dataset, batch),)))
+                if len(pending) >= workers * 2:
+                    queue.put(pending.popleft().get())
+            num += len(batch)
+            if num % (batch_size * 10) < batch_size:
+                log.info("Indexed %d entries", num)
+        while pending and not errors:
+            queue.put(pending.popleft().get())
+    finally:
+        for thread in threads:
+            queue.put(None)
+        for thread in threads:
+            thread.join()
+        if pool is not None:
+            if errors:
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
+
+    if errors:
+        raise errors[0]
+    return num
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if len(batch):
+        yield batch
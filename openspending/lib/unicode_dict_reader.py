@@ -23,11 +23,7 @@ class UnicodeDictReader(object):
         return (self._decode_row(row) for row in self.reader)
 
     def _decode_row(self, row):
-        return dict(
-            (self.keymap[k], self._decode_str(v)) for k, v in row.iteritems()
-        )
-
-    def _decode_str(self, s):
-        if s is None:
-            return None
-        return s.decode(self.encoding)
+        keymap, encoding = self.keymap, self.encoding
+        return dict((keymap[k], v if v is None else v.decode(encoding)) \
+                    for k, v in row.iteritems())
+
@@ -1,8 +1,12 @@
 import csv
 import re
+import logging
 from hashlib import sha1
+from multiprocessing import Pool, current_process
 from unidecode import unidecode
 
+log = logging.getLogger(__name__)
+
 def flatten(data, sep='.'):
     out = {}
     for k, v in data.items():
@@ -41,3 +45,21 @@ def slugify(text, delimiter='-'):
         result.extend(unidecode(word).split())
     return unicode(delimiter.join(result))
 
+
+def process_pool(workers, initializer=None, initargs=()):
+    '''\
+    Start a pool of ``workers`` processes, or return ``None`` if the work
+    should be done in the calling process instead. This is the case for
+    a single worker, and for daemonic processes (such as the workers of
+    celery's default process pool), which cannot have children; run
+    celeryd with ``celeryd.pool = threads`` (or ``solo``) to use pools in
+    background tasks.
+    '''
+    if workers is None or workers <= 1:
+        return None
+    if current_process().daemon:
+        log.warning("Cannot start %d worker processes from the daemonic "
+                    "process %s, working in-process instead.", workers,
+                    current_process().name)
+        return None
+    return Pool(workers, initializer, initargs)
@@ -1,11 +1,37 @@
 #coding: utf-8
+from collections import OrderedDict
 from json import dumps, loads
+from StringIO import StringIO
 from sqlalchemy.types import Text, MutableType, TypeDecorator
 
 from openspending.model import meta as db 
 
 ALIAS_PLACEHOLDER = u'‽'
 
+def copy_data(columns, rows):
+    """ Format ``rows`` as CSV for ``COPY ... WITH CSV NULL '\\N'``.
+    ``None`` is written as an unquoted ``\\N`` and all other non-numeric
+    values are quoted, so that NULL, empty strings and the text ``\\N``
+    can be told apart. (``csv.writer`` cannot do this, as it writes
+    ``None`` as an empty string.) """
+    lines = []
+    for row in rows:
+        values = []
+        for column in columns:
+            value = row.get(column)
+            if value is None:
+                value = '\\N'
+            elif isinstance(value, float):
+                value = repr(value)
+            elif isinstance(value, (int, long)):
+                value = str(value)
+            else:
+                value = unicode(value).encode('utf-8')
+                value = '"%s"' % value.replace('"', '""')
+            values.append(value)
+        lines.append(','.join(values))
+    return '\n'.join(lines) + '\n'
+
 class JSONType(MutableType, TypeDecorator):
     impl = Text
 
@@ -48,17 +74,82 @@ class TableHandler(object):
         existing row or create a new one. In both cases, the ID
         of the changed row will be returned. 
         """
+        return self._upsert_row(bind, data, unique_columns)[0]
+
+    def _upsert_row(self, bind, data, unique_columns):
+        """ Like ``_upsert``, but return a tuple of the ID and whether
+        the row was newly created. """
         key = db.and_(*[self.table.c[c]==data.get(c) for \
                 c in unique_columns])
         q = self.table.update(key, data)
         if bind.execute(q).rowcount == 0:
             q = self.table.insert(data)
             rs = bind.execute(q)
-            return rs.inserted_primary_key[0]
+            return rs.inserted_primary_key[0], True
         else:
             q = self.table.select(key)
             row = bind.execute(q).fetchone()
-            return row['id']
+            return row['id'], False
+
+    def _upsert_many(self, bind, rows, key):
+        """ Upsert a batch of rows which are identified by the single
+        unique column ``key``. Rows which already exist are updated
+        with one ``executemany`` statement, all others are inserted in
+        bulk (using ``COPY`` on PostgreSQL). If a key occurs more than
+        once within the batch, the last row wins. Returns the number of
+        newly inserted rows.
+        """
+        batch = OrderedDict()
+        for row in rows:
+            batch[row[key]] = row
+        if not len(batch):
+            return 0
+
+        column = self.table.c[key]
+        keys, existing = batch.keys(), set()
+        # look up keys in chunks to stay below the bind parameter
+        # limits of some backends (e.g. 999 on SQLite).
+        for i in xrange(0, len(keys), 500):
+            q = db.select([column], column.in_(keys[i:i+500]))
+            existing.update([r[0] for r in bind.execute(q).fetchall()])
+
+        updates, inserts = [], []
+        for value, row in batch.items():
+            if value in existing:
+                params = dict([(k, v) for k, v in row.items() if k != key])
+                params['_key'] = value
+                updates.append(params)
+            else:
+                inserts.append(row)
+
+        if len(updates):
+            q = self.table.update(column==db.bindparam('_key'))
+            bind.execute(q, updates)
+        if len(inserts):
+            if bind.dialect.name == 'postgresql':
+                self._copy(bind, inserts)
+            else:
+                bind.execute(self.table.insert(), inserts)
+        return len(inserts)
+
+    def _copy(self, bind, rows):
+        """ Insert a list of rows using PostgreSQL's ``COPY FROM``, which
+        is considerably faster than individual ``INSERT`` statements.
+
+        Like all other writes of the loader, this does not take part in
+        the session's transaction: the rows are committed right away on
+        a connection of its own. """
+        columns = rows[0].keys()
+        sio = StringIO(copy_data(columns, rows))
+        stmt = 'COPY "%s" (%s) FROM STDIN WITH CSV NULL \'\\N\'' % \
+                (self.table.name, ', '.join(['"%s"' % c for c in columns]))
+        conn = bind.raw_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.copy_expert(stmt, sio)
+            conn.commit()
+        finally:
+            conn.close()
 
     def _flush(self, bind):
         """ Delete all rows in the table. """
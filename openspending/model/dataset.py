@@ -8,22 +8,38 @@ of logic functions upon which all other queries and loading functions rely.
 """
 import math
 import logging
+import threading
 from collections import defaultdict
 from datetime import datetime
 from itertools import count
+from json import dumps
 from sqlalchemy import ForeignKeyConstraint
+from sqlalchemy.orm.attributes import get_history, set_committed_value
 
 from openspending.model import meta as db
 from openspending.lib.util import hash_values
+from openspending.lib.lru import LRUCache
 
 from openspending.model.common import TableHandler, JSONType, \
         ALIAS_PLACEHOLDER
 from openspending.model.dimension import CompoundDimension, \
         AttributeDimension, DateDimension
 from openspending.model.dimension import Measure
+from openspending.model.rollup import Rollup
 
 log = logging.getLogger(__name__)
 
+# Number of dataset models kept in memory by each process.
+MODEL_CACHE_SIZE = 100
+
+# The attributes which make up the in-memory model of a dataset and are
+# shared between all instances of the same dataset (see ``_reconstruct``).
+MODEL_ATTRIBUTES = ('dimensions', 'measures', '_fields', '_field_index',
+                    'meta', 'table', 'alias', 'rollups')
+
+_model_cache = LRUCache(MODEL_CACHE_SIZE)
+_model_lock = threading.Lock()
+
 class Dataset(TableHandler, db.Model):
     """ The dataset is the core entity of any access to data. All
     requests to the actual data store are routed through it, as well
@@ -47,6 +63,8 @@ class Dataset(TableHandler, db.Model):
     private = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
+    data_version = db.Column(db.Integer, default=0)
+    entry_count = db.Column(db.Integer)
     data = db.Column(JSONType, default=dict)
 
     languages = db.association_proxy('_languages', 'code')
@@ -78,12 +96,66 @@ class Dataset(TableHandler, db.Model):
         return self.data.get('mapping', {})
 
     @db.reconstructor
+    def _reconstruct(self):
+        """ Set up the model when the dataset is loaded from the
+        SQLAlchemy store. Building the model creates tables for the facts
+        and for each dimension, so it is kept in a process-wide cache and
+        shared by all instances of the dataset as long as its mapping
+        does not change. """
+        key = self._model_key()
+        with _model_lock:
+            cached = _model_cache.get(self.name)
+            if cached is not None and cached[0] == key:
+                model = cached[1]
+                fresh = cached[2] == self.data_version
+                if not fresh:
+                    _model_cache[self.name] = (key, model, self.data_version)
+        if cached is None or cached[0] != key:
+            self._load_model()
+            model = tuple(getattr(self, name) for name in MODEL_ATTRIBUTES)
+            with _model_lock:
+                _model_cache[self.name] = (key, model, self.data_version)
+            return
+
+        for name, value in zip(MODEL_ATTRIBUTES, model):
+            setattr(self, name, value)
+        self.bind = db.engine
+        self._is_generated = None
+        # the rollups may have been dropped by another process.
+        for rollup in self.rollups:
+            rollup._exists = None
+        if not fresh:
+            # the data has changed since the model was last used, so
+            # member keys remembered from earlier loads may be stale.
+            for dimension in self.compounds:
+                dimension.clear_cache()
+
+    def _model_key(self):
+        """ The model only depends on the name and mapping of a dataset;
+        the id and creation time tell apart re-created datasets. """
+        mapping = dumps(self.mapping, sort_keys=True)
+        return (self.id, self.created_at, hash_values([mapping]))
+
+    def _forget_model(self):
+        """ Remove the model of this dataset from the cache, e.g. since
+        its tables are being dropped. """
+        with _model_lock:
+            if self.name in _model_cache:
+                del _model_cache[self.name]
+
+    def reload_model(self):
+        """ Rebuild the model after the mapping of the dataset has been
+        changed, replacing the model cached for the dataset. """
+        self._forget_model()
+        self._load_model()
+
     def _load_model(self):
         """ Construct the in-memory object representation of this
         dataset's dimension and measures model.
 
-        This is called upon initialization and deserialization of
-        the dataset from the SQLAlchemy store.
+        This is called upon initialization and, unless a cached model
+        can be used, deserialization of the dataset from the SQLAlchemy
+        store.
         """
         self.dimensions = []
         self.measures = []
@@ -99,20 +171,19 @@ class Dataset(TableHandler, db.Model):
             else:
                 dimension = CompoundDimension(self, dim, data)
             self.dimensions.append(dimension)
+        self._fields = self.dimensions + self.measures
+        self._field_index = dict((f.name, f) for f in self._fields)
         self.init()
         self._is_generated = None
 
     def __getitem__(self, name):
         """ Access a field (dimension or measure) by name. """
-        for field in self.fields:
-            if field.name == name:
-                return field
-        raise KeyError()
+        return self._field_index[name]
 
     @property
     def fields(self):
         """ Both the dimensions and metrics in this dataset. """
-        return self.dimensions + self.measures
+        return self._fields
 
     @property
     def compounds(self):
@@ -135,6 +206,25 @@ class Dataset(TableHandler, db.Model):
         for field in self.fields:
             field.init(self.meta, self.table)
         self.alias = self.table.alias('entry')
+        self._init_rollups()
+
+    def _init_rollups(self):
+        """ Set up the possible rollups of this dataset, ordered by
+        size: one by year and one by year and each compound dimension.
+        Rollups are only available for datasets with a time dimension.
+        """
+        self.rollups = []
+        try:
+            if not isinstance(self['time'], DateDimension):
+                return
+        except KeyError:
+            return
+        self.rollups.append(Rollup(self))
+        for dimension in self.compounds:
+            if dimension.name != 'time':
+                self.rollups.append(Rollup(self, dimension))
+        for rollup in self.rollups:
+            rollup.init(self.meta)
 
     def generate(self):
         """ Create the tables and columns necessary for this dataset
@@ -142,8 +232,11 @@ class Dataset(TableHandler, db.Model):
         """
         for field in self.fields:
             field.generate(self.meta, self.table)
+        # the model (and so the table) may be shared with earlier calls.
+        constraints = set(c.name for c in self.table.constraints)
         for dim in self.dimensions:
-            if isinstance(dim, CompoundDimension):
+            if isinstance(dim, CompoundDimension) and \
+                    'fk_'+self.name+'_'+dim.name not in constraints:
                 self.table.append_constraint(ForeignKeyConstraint(
                     [ dim.name+'_id' ], [ dim.table.name + '.id' ],
                     #use_alter=True,
@@ -163,7 +256,7 @@ class Dataset(TableHandler, db.Model):
         #self.tx.commit()
         #self.tx = self.bind.begin()
 
-    def _make_key(self, data):
+    def make_key(self, data):
         """ Generate a unique identifier for an entry. This is better 
         than SQL auto-increment because it is stable across mutltiple
         loads and thus creates stable URIs for entries. 
@@ -178,32 +271,151 @@ class Dataset(TableHandler, db.Model):
             uniques.append(obj)
         return hash_values(uniques)
 
-    def load(self, data):
-        """ Handle a single entry of data in the mapping source format, 
-        i.e. with all needed columns. This will propagate to all dimensions
-        and set values as appropriate. """
+    def preload(self):
+        """ Warm up the member key caches of all compound dimensions
+        before loading data into an existing dataset. """
+        if not self.is_generated:
+            return
+        for dimension in self.compounds:
+            dimension.preload(self.bind)
+
+    def _entry(self, data):
+        """ Convert an entry in the mapping source format into a row of
+        the fact table, loading all dimension members on the way. """
         entry = dict()
         for field in self.fields:
             field_data = data[field.name]
             entry.update(field.load(self.bind, field_data))
-        entry['id'] = self._make_key(data)
-        self._upsert(self.bind, entry, ['id'])
+        entry['id'] = self.make_key(data)
+        return entry
+
+    def touch(self):
+        """ Increment the ``data_version`` of the dataset to signal that
+        its data has changed, e.g. to invalidate cached aggregates. The
+        version is only incremented once until the session is flushed. """
+        if not get_history(self, 'data_version').has_changes():
+            self.data_version = (self.data_version or 0) + 1
+
+    def load(self, data):
+        """ Handle a single entry of data in the mapping source format,
+        i.e. with all needed columns. This will propagate to all dimensions
+        and set values as appropriate. Returns the id of the entry and
+        whether it was newly created (see ``add_entries``). """
+        self.touch()
+        self.drop_rollups()
+        entry = self._entry(data)
+        _, created = self._upsert_row(self.bind, entry, ['id'])
+        return entry['id'], created
+
+    def load_batch(self, rows):
+        """ Load a list of entries in the mapping source format. This is
+        equivalent to calling ``load()`` for each of them, but the fact
+        table is written in bulk: existing entries are reconciled by their
+        key and all new entries are inserted with a single statement.
+        Returns the ids of the entries, in order, and the number of newly
+        created entries. """
+        self.touch()
+        self.drop_rollups()
+        entries = [self._entry(data) for data in rows]
+        created = self._upsert_many(self.bind, entries, 'id')
+        return [entry['id'] for entry in entries], created
+
+    @property
+    def num_entries(self):
+        """ The number of entries in the dataset. This is kept up to
+        date by the importer, so unlike ``len()`` it does not need to
+        count the fact table (except the first time it is used). """
+        if self.entry_count is None:
+            return self.count_entries()
+        return self.entry_count
+
+    def count_entries(self):
+        """ Count the entries in the fact table, correcting the number
+        returned by ``num_entries``. """
+        count = self._count_entries()
+        self._update_entry_count(count)
+        return count
+
+    def _count_entries(self):
+        if not self.is_generated:
+            return 0
+        rp = self.bind.execute(self.alias.count())
+        return rp.fetchone()[0]
+
+    def add_entries(self, created):
+        """ Add ``created`` new entries to the entry count. Loading data
+        does not update the count, so that callers can do so once for
+        many entries. """
+        if not created:
+            return
+        if self.entry_count is None:
+            self.count_entries()
+        else:
+            table = self.__table__
+            self._update_entry_count(self.entry_count + created,
+                                     table.c.entry_count + created)
+
+    def _update_entry_count(self, count, expr=None):
+        """ Set the entry count right away rather than with the next
+        commit of the session, as the data itself is written directly
+        as well. An SQL ``expr`` is used to add to the stored count, so
+        that concurrent imports do not overwrite each other's counts.
+        The count is not a change of the dataset's metadata, so it keeps
+        its ``updated_at`` time. """
+        if self.id is None:
+            self.entry_count = count
+            return
+        table = self.__table__
+        q = table.update(table.c.id==self.id,
+                         {'entry_count': count if expr is None else expr,
+                          'updated_at': table.c.updated_at})
+        self.bind.execute(q)
+        set_committed_value(self, 'entry_count', count)
+
+    def build_rollups(self):
+        """ Materialize all rollups of this dataset from the current
+        facts. Afterwards ``aggregate()`` will answer queries from the
+        smallest rollup that covers them. """
+        if not self.is_generated:
+            return
+        for rollup in self.rollups:
+            log.info("Building rollup: %s", rollup.name)
+            rollup.build(self.bind)
+
+    def drop_rollups(self):
+        """ Drop the materialized rollups, e.g. since they are stale. """
+        for rollup in self.rollups:
+            rollup.drop(self.bind)
+
+    def rollup_for(self, keys):
+        """ Find the smallest materialized rollup which can answer a
+        query referring to the given ``keys``, or return ``None``. """
+        for rollup in self.rollups:
+            if rollup.covers(keys) and rollup.exists:
+                return rollup
 
     def flush(self):
         """ Delete all data from the dataset tables but leave the table
         structure intact.
         """
+        self.touch()
+        self.drop_rollups()
         for dimension in self.dimensions:
             dimension.flush(self.bind)
         self._flush(self.bind)
+        self._update_entry_count(0)
 
     def drop(self):
         """ Drop all tables created as part of this dataset, i.e. by calling
         ``generate()``. This will of course also delete the data itself.
         """
+        self.touch()
+        self._forget_model()
+        self.drop_rollups()
         self._drop(self.bind)
         for dimension in self.dimensions:
             dimension.drop(self.bind)
+        self._update_entry_count(0)
 
     def key(self, key):
         """ For a given ``key``, find a column to indentify it in a query.
@@ -220,6 +432,50 @@ class Dataset(TableHandler, db.Model):
             return dimension.alias.c[attr_name]
         return self.alias.c[dimension.column.name]
 
+    def _column_decoder(self, keys):
+        """ Work out once per query how the labelled columns of a
+        result (``<field>_<attribute>``, see ``use_labels``) are nested
+        in a result row: returns a ``(field, attribute, taxonomy)`` triple
+        for each of the ``keys``. ``field`` is ``None`` for columns of
+        the fact table and for unlabelled columns, which are kept at the
+        top level, and ``taxonomy`` is only set for compound dimensions.
+        """
+        decoder = []
+        for key in keys:
+            if not '_' in key:
+                if key == 'entries':
+                    key = 'num_entries'
+                decoder.append((None, key, None))
+                continue
+            field, attr = key.split('_', 1)
+            field = field.replace(ALIAS_PLACEHOLDER, '_')
+            if field == 'entry':
+                decoder.append((None, attr, None))
+                continue
+            # TODO: backwards-compat?
+            dimension = self[field]
+            taxonomy = None
+            if isinstance(dimension, CompoundDimension):
+                taxonomy = dimension.taxonomy
+            decoder.append((field, attr, taxonomy))
+        return decoder
+
+    def _decode_row(self, decoder, row):
+        """ Nest the values of a result ``row`` using a ``decoder``
+        as returned by ``_column_decoder``. """
+        result = {}
+        for (field, attr, taxonomy), value in zip(decoder, row):
+            if field is None:
+                result[attr] = value
+                continue
+            nested = result.get(field)
+            if nested is None:
+                nested = result[field] = {}
+                if taxonomy is not None:
+                    nested['taxonomy'] = taxonomy
+            nested[attr] = value
+        return result
+
     def entries(self, conditions="1=1", order_by=None, limit=None,
             offset=0, step=10000):
         """ Generate a fully denormalized view of the entries on this 
@@ -228,6 +484,11 @@ class Dataset(TableHandler, db.Model):
 
         This is somewhat similar to the entries collection in the fully
         denormalized schema before OpenSpending 0.11 (MongoDB).
+
+        Results are fetched in pages of ``step`` entries. Unless a custom
+        ``order_by`` is given, each page resumes after the last ``id``
+        seen (keyset pagination) instead of using a growing ``OFFSET``,
+        so that iterating over the full table stays linear.
         """
         if not self.is_generated:
             return
@@ -238,44 +499,45 @@ class Dataset(TableHandler, db.Model):
         selects = [f.selectable for f in self.fields] + [self.alias.c.id]
 
         # enforce stable sorting:
-        if order_by is None:
+        keyset = order_by is None
+        if keyset:
             order_by = [self.alias.c.id.asc()]
 
+        last_id = None
         for i in count():
-            qoffset = offset + (step * i)
             qlimit = step
             if limit is not None:
                 qlimit = min(limit-(step*i), step)
             if qlimit <= 0:
                 break
 
-            query = db.select(selects, conditions, joins, order_by=order_by,
+            qconditions = conditions
+            if not keyset:
+                qoffset = offset + (step * i)
+            elif last_id is None:
+                qoffset = offset
+            else:
+                qoffset = 0
+                qconditions = db.and_(conditions, self.alias.c.id > last_id)
+
+            query = db.select(selects, qconditions, joins, order_by=order_by,
                               use_labels=True, limit=qlimit, offset=qoffset)
             rp = self.bind.execute(query)
+            decoder = self._column_decoder(rp.keys())
 
-            first_row = True
+            num_rows = 0
             while True:
                 row = rp.fetchone()
                 if row is None:
-                    if first_row:
-                        return
                     break
-                first_row = False
-                result = {}
-                for k, v in row.items():
-                    field, attr = k.split('_', 1)
-                    field = field.replace(ALIAS_PLACEHOLDER, '_')
-                    if field == 'entry':
-                        result[attr] = v
-                    else:
-                        if not field in result:
-                            result[field] = dict()
-
-                            # TODO: backwards-compat?
-                            if isinstance(self[field], CompoundDimension):
-                                result[field]['taxonomy'] = self[field].taxonomy
-                        result[field][attr] = v
+                num_rows += 1
+                result = self._decode_row(decoder, row)
+                # the label of the id can be de-duplicated, e.g. if
+                # the dataset has an ``entry_id`` attribute.
+                last_id = result['id'] = row[self.alias.c.id]
                 yield result
+            if num_rows < qlimit:
+                return
 
     def aggregate(self, measure='amount', drilldowns=None, cuts=None, 
             page=1, pagesize=10000, order=None):
@@ -300,6 +562,14 @@ class Dataset(TableHandler, db.Model):
         ``pagesize``
             Page the drilldown result into page of size *pagesize*.
             type: `int`
+
+            Paging is done by the database. Unless the requested page
+            holds all cells, the summary is computed by a separate query
+            over the whole result.
+
+        If the dataset has materialized rollups (see ``build_rollups``),
+        queries are answered from the smallest one that covers all of
+        the drilldown, cut and order keys.
         ``order``
             Sort the result based on the dimension *sort_dimension*.
             This may be `None` (*default*) or a `list` of two-`tuples`
@@ -333,21 +603,33 @@ class Dataset(TableHandler, db.Model):
         cuts = cuts or []
         drilldowns = drilldowns or []
         order = order or []
-        joins = self.alias
-        fields = [db.func.sum(self.alias.c[measure]).label(measure), 
-                  db.func.count(self.alias.c.id).label("entries")]
-        labels = {
-            'year': self['time']['year'].column_alias.label('year'),
-            'month': self['time']['yearmonth'].column_alias.label('month'),
-            }
         dimensions = set(drilldowns + [k for k,v in cuts] + [o[0] for o in order])
+        rollup = self.rollup_for(dimensions)
+        if rollup is not None:
+            joins = rollup.alias
+            fields = [db.func.sum(joins.c[measure]).label(measure),
+                      db.func.sum(joins.c.entries).label("entries")]
+            labels = {'year': joins.c.year.label('year')}
+        else:
+            joins = self.alias
+            fields = [db.func.sum(self.alias.c[measure]).label(measure), 
+                      db.func.count(self.alias.c.id).label("entries")]
+            labels = {
+                'year': self['time']['year'].column_alias.label('year'),
+                'month': self['time']['yearmonth'].column_alias.label('month'),
+                }
         for dimension in dimensions:
             if dimension in labels:
+                if rollup is not None:
+                    continue
                 _name = 'time'
             else:
                 _name = dimension.split('.')[0]
             if _name not in [c.table.name for c in joins.columns]:
-                joins = self[_name].join(joins)
+                if rollup is not None:
+                    joins = rollup.join(joins, self[_name])
+                else:
+                    joins = self[_name].join(joins)
 
         group_by = []
         for key in dimensions:
@@ -384,50 +666,49 @@ class Dataset(TableHandler, db.Model):
                 column = self.key(key)
             order_by.append(column.desc() if direction else column.asc())
 
+        # Order by the grouped columns last, so that cells with equal
+        # sort keys keep their place from page to page.
+        order_by = (order_by or [measure + ' desc']) + group_by
+
+        offset = ((page-1)*pagesize)
         query = db.select(fields, conditions, joins,
-                       order_by=order_by or [measure + ' desc'],
-                       group_by=group_by, use_labels=True)
+                       order_by=order_by,
+                       group_by=group_by, use_labels=True,
+                       limit=pagesize, offset=offset)
         summary = {measure: 0.0, 'num_entries': 0}
         drilldown = []
         rp = self.bind.execute(query)
+        decoder = self._column_decoder(rp.keys())
         while True:
             row = rp.fetchone()
             if row is None:
                 break
-            result = {}
-            for key, value in row.items():
-                if key == measure:
-                    summary[measure] += value or 0
-                if key == 'entries':
-                    summary['num_entries'] += value or 0
-                if '_' in key:
-                    dimension, attribute = key.split('_', 1)
-                    dimension = dimension.replace(ALIAS_PLACEHOLDER, '_')
-                    if dimension == 'entry':
-                        result[attribute] = value
-                    else:
-                        if not dimension in result:
-                            result[dimension] = {}
-
-                            # TODO: backwards-compat?
-                            if isinstance(self[dimension], CompoundDimension):
-                                result[dimension]['taxonomy'] = \
-                                        self[dimension].taxonomy
-                        result[dimension][attribute] = value
-                else:
-                    if key == 'entries':
-                        key = 'num_entries'
-                    result[key] = value
-            drilldown.append(result)
-        offset = ((page-1)*pagesize)
+            summary[measure] += row[measure] or 0
+            summary['num_entries'] += row['entries'] or 0
+            drilldown.append(self._decode_row(decoder, row))
+
+        num_drilldowns = len(drilldown)
+        if offset > 0 or num_drilldowns >= pagesize:
+            # The page does not hold all cells, so the totals need to be
+            # computed by the database over the whole grouped result.
+            cells = db.select(fields, conditions, joins,
+                              group_by=group_by, use_labels=True)
+            cells = cells.alias('cells')
+            q = db.select([db.func.count(),
+                           db.func.sum(cells.c[measure]),
+                           db.func.sum(cells.c['entries'])])
+            num_drilldowns, total, num_entries = \
+                    self.bind.execute(q).fetchone()
+            summary[measure] = total or 0.0
+            summary['num_entries'] = num_entries or 0
 
         # do we really need all this:
-        summary['num_drilldowns'] = len(drilldown)
+        summary['num_drilldowns'] = num_drilldowns
         summary['page'] = page
-        summary['pages'] = int(math.ceil(len(drilldown)/float(pagesize)))
+        summary['pages'] = int(math.ceil(num_drilldowns/float(pagesize)))
         summary['pagesize'] = pagesize
 
-        return {'drilldown': drilldown[offset:offset+pagesize],
+        return {'drilldown': drilldown,
                 'summary': summary}
 
     def __repr__(self):
@@ -443,10 +724,11 @@ class Dataset(TableHandler, db.Model):
         return sorted([r[attribute] for r in rp.fetchall()])
 
     def __len__(self):
-        if not self.is_generated:
-            return 0
-        rp = self.bind.execute(self.alias.count())
-        return rp.fetchone()[0]
+        return self._count_entries()
+
+    def __nonzero__(self):
+        # a dataset without entries is still a dataset.
+        return True
 
     def as_dict(self):
         return {
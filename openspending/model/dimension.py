@@ -1,4 +1,5 @@
 
+from openspending.lib.lru import LRUCache
 from openspending.model import meta as db
 from openspending.model.attribute import Attribute
 from openspending.model.common import TableHandler, ALIAS_PLACEHOLDER
@@ -80,6 +81,9 @@ class CompoundDimension(Dimension, TableHandler):
     have sub-dimensions (i.e. snowflake schema).
     """
 
+    # Maximum number of member keys held in memory while loading.
+    PK_CACHE_SIZE = 10000
+
     def __init__(self, dataset, name, data):
         Dimension.__init__(self, dataset, name, data)
         self.taxonomy = data.get('taxonomy', name)
@@ -88,8 +92,7 @@ class CompoundDimension(Dimension, TableHandler):
         for name, attr in data.get('attributes', {}).items():
             self.attributes.append(Attribute(self, name, attr))
 
-        # TODO: possibly use a LRU later on?
-        self._pk_cache = {}
+        self._pk_cache = LRUCache(self.PK_CACHE_SIZE)
 
     def join(self, from_clause):
         """ This will return a query fragment that can be used to establish
@@ -101,12 +104,18 @@ class CompoundDimension(Dimension, TableHandler):
         """ Clear all data in the dimension table but keep the table structure
         intact. """
         self._flush(bind)
+        self.clear_cache()
     
     def drop(self, bind):
         """ Drop the dimension table and all data within it. """
         self._drop(bind)
+        self.clear_cache()
         del self.column
 
+    def clear_cache(self):
+        """ Forget the member keys remembered while loading. """
+        self._pk_cache.clear()
+
     @property
     def column_alias(self):
         """ This an aliased pointer to the FK column on the fact table. """
@@ -148,13 +157,21 @@ class CompoundDimension(Dimension, TableHandler):
             attr_data = row[attr.name]
             dim.update(attr.load(bind, attr_data))
         name = dim['name']
-        if name in self._pk_cache:
-            pk = self._pk_cache[name]
-        else:
+        pk = self._pk_cache.get(name)
+        if pk is None:
             pk = self._upsert(bind, dim, ['name'])
             self._pk_cache[name] = pk
         return {self.column.name: pk}
 
+    def preload(self, bind):
+        """ Warm up the member key cache with the names and IDs of
+        existing members, so that re-loading them does not require an
+        upsert. At most ``PK_CACHE_SIZE`` members are read. """
+        query = db.select([self.table.c.id, self.table.c.name],
+                          limit=self._pk_cache.maxsize)
+        for row in bind.execute(query):
+            self._pk_cache[row['name']] = row['id']
+
     def members(self, conditions="1=1", limit=0, offset=0):
         """ Get a listing of all the members of the dimension (i.e. all the
         distinct values) matching the filter in ``conditions``. This can also be
@@ -215,7 +232,13 @@ class DateDimension(CompoundDimension):
         for name, attr in self.DATE_ATTRIBUTES.items():
             self.attributes.append(Attribute(self, name, attr))
 
-        self._pk_cache = {}
+        self._pk_cache = LRUCache(self.PK_CACHE_SIZE)
+        # member keys by the raw date value, to skip formatting:
+        self._date_cache = LRUCache(self.PK_CACHE_SIZE)
+
+    def clear_cache(self):
+        super(DateDimension, self).clear_cache()
+        self._date_cache.clear()
 
     def load(self, bind, value):
         """ Given a Python datetime.date, generate a date dimension with the
@@ -228,7 +251,13 @@ class DateDimension(CompoundDimension):
         * week - calendar week of the year (e.g. 42)
         * day - day of the month (e.g. 8)
         * yearmonth - combined year and month (e.g. 201112)
+
+        As most datasets only mention a few distinct dates, the member
+        key is memoized by the date value itself.
         """
+        pk = self._date_cache.get(value)
+        if pk is not None:
+            return {self.column.name: pk}
         data = {
                 'name': value.isoformat(),
                 'label': value.strftime("%d. %B %Y"),
@@ -239,7 +268,9 @@ class DateDimension(CompoundDimension):
                 'day': value.strftime('%d'),
                 'yearmonth': value.strftime('%Y%m')
             }
-        return super(DateDimension, self).load(bind, data)
+        result = super(DateDimension, self).load(bind, data)
+        self._date_cache[value] = result[self.column.name]
+        return result
 
     def __repr__(self):
         return "<DateDimension(%s:%s)>" % (self.name, self.attributes)
@@ -7,7 +7,7 @@ from sqlalchemy import or_, and_
 from sqlalchemy.orm import reconstructor, aliased
 
 from sqlalchemy import orm
-from sqlalchemy import func, select
+from sqlalchemy import func, select, bindparam
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.associationproxy import association_proxy
@@ -0,0 +1,96 @@
+from openspending.model import meta as db
+from openspending.model.common import TableHandler
+
+
+class Rollup(TableHandler):
+    """ A rollup is a pre-computed aggregate of a dataset's fact table,
+    holding the sum of each measure and the number of entries by year
+    and (optionally) by the members of one compound dimension. Queries
+    which only refer to these keys can be answered from the rollup
+    instead of scanning the full fact table.
+
+    Rollups are materialized by ``build()`` after data has been loaded
+    and dropped as soon as the facts change, so an existing rollup table
+    is always up to date.
+    """
+
+    def __init__(self, dataset, dimension=None):
+        self.dataset = dataset
+        self.dimension = dimension
+        self.name = dimension.name if dimension is not None else 'year'
+        self._exists = None
+
+    def init(self, meta):
+        """ Create the SQLAlchemy model of the rollup table. """
+        self._init_table(meta, self.dataset.name, 'rollup__' + self.name)
+        self.table.append_column(db.Column('year', db.UnicodeText))
+        if self.dimension is not None:
+            self.table.append_column(db.Column(self.dimension.column.name,
+                                               db.Integer))
+        for measure in self.dataset.measures:
+            self.table.append_column(db.Column(measure.column.name,
+                                               db.Float))
+        self.table.append_column(db.Column('entries', db.Integer))
+        self.alias = self.table.alias('rollup')
+
+    @property
+    def exists(self):
+        if self._exists is None:
+            self._exists = self.table.exists()
+        return self._exists
+
+    def covers(self, keys):
+        """ Check whether a query referring to the given drilldown, cut
+        and order ``keys`` can be answered from this rollup. """
+        for key in keys:
+            if key == 'year':
+                continue
+            if self.dimension is not None and \
+                    key.split('.')[0] == self.dimension.name:
+                continue
+            return False
+        return True
+
+    def join(self, from_clause, dimension):
+        """ Join the table of a covered ``dimension`` to the rollup. """
+        column = self.alias.c[dimension.column.name]
+        return from_clause.join(dimension.alias,
+                                dimension.alias.c.id==column)
+
+    def build(self, bind):
+        """ (Re-)compute the rollup table from the fact table. """
+        self.drop(bind)
+        self._generate_table()
+        self._exists = True
+
+        facts = self.dataset.alias
+        year = self.dataset['time']['year'].column_alias
+        joins = self.dataset['time'].join(facts)
+        columns = [year.label('year')]
+        group_by = [year]
+        if self.dimension is not None:
+            column = self.dimension.column_alias
+            columns.append(column.label(self.dimension.column.name))
+            group_by.append(column)
+        for measure in self.dataset.measures:
+            column = facts.c[measure.column.name]
+            columns.append(db.func.sum(column).label(measure.column.name))
+        columns.append(db.func.count(facts.c.id).label('entries'))
+
+        query = db.select(columns, from_obj=joins, group_by=group_by)
+        rp = bind.execute(query)
+        while True:
+            rows = rp.fetchmany(1000)
+            if not len(rows):
+                break
+            bind.execute(self.table.insert(),
+                         [dict(row.items()) for row in rows])
+
+    def drop(self, bind):
+        """ Drop the rollup table, e.g. because the facts have changed. """
+        if self.exists:
+            self.table.drop(bind)
+        self._exists = False
+
+    def __repr__(self):
+        return "<Rollup(%s:%s)>" % (self.dataset.name, self.name)
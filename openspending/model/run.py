@@ -1,10 +1,18 @@
 from datetime import datetime
 
 from openspending.model import meta as db
+from openspending.model.common import JSONType
 from openspending.model.dataset import Dataset
 from openspending.model.source import Source
 
 
+# Entries created or changed by a run, which still need to be indexed.
+run_entry_table = db.Table('run_entry', db.metadata,
+    db.Column('run_id', db.Integer, db.ForeignKey('run.id'), index=True),
+    db.Column('entry_id', db.Unicode(42))
+    )
+
+
 class Run(db.Model):
     """ A run is a generic grouping object for background operations
     that perform logging to the frontend. """
@@ -24,6 +32,17 @@ class Run(db.Model):
                            nullable=True)
     source_id = db.Column(db.Integer, db.ForeignKey('source.id'),
                            nullable=True)
+    # Number of source rows loaded and committed so far (for imports).
+    checkpoint = db.Column(db.Integer)
+    # Error counters of an import as of its checkpoint: errors, rows
+    # which failed and ``[attribute, column, datatype, count]`` lists.
+    num_errors = db.Column(db.Integer)
+    failed_rows = db.Column(db.Integer)
+    error_counts = db.Column(JSONType, default=list)
+    # Whether all entries of the dataset are re-indexed after the run
+    # (e.g. an import into an empty dataset) rather than those recorded
+    # with ``record_entries``.
+    index_all = db.Column(db.Boolean, default=False)
 
     dataset = db.relationship(Dataset,
                               backref=db.backref('runs',
@@ -40,10 +59,55 @@ class Run(db.Model):
         self.dataset = dataset
         self.source = source
 
+    def record_entries(self, entry_ids):
+        """ Record the ids of entries which were created or changed
+        during this run, so that only these need to be re-indexed. """
+        if not len(entry_ids):
+            return
+        rows = [{'run_id': self.id, 'entry_id': i} for i in entry_ids]
+        db.engine.execute(run_entry_table.insert(), rows)
+
+    def entry_ids(self, step=10000):
+        """ Generate the ids of all entries recorded for this run. """
+        table = run_entry_table
+        q = db.select([table.c.entry_id], table.c.run_id==self.id)
+        rp = db.engine.execute(q)
+        while True:
+            rows = rp.fetchmany(step)
+            if not len(rows):
+                break
+            for row in rows:
+                yield row[0]
+
+    def count_entries(self):
+        """ Count the entries recorded for this run. """
+        table = run_entry_table
+        q = db.select([db.func.count()], table.c.run_id==self.id)
+        return db.engine.execute(q).scalar()
+
+    def clear_entries(self):
+        """ Forget the recorded entries, e.g. once they are indexed. """
+        table = run_entry_table
+        db.engine.execute(table.delete(table.c.run_id==self.id))
+
     @classmethod
     def by_id(cls, id):
         return db.session.query(cls).filter_by(id=id).first()
 
+    @classmethod
+    def resumable(cls, operation, source):
+        """ Find the most recent run of ``operation`` on ``source`` if it
+        was interrupted (i.e. it is still marked as running) after it
+        recorded a checkpoint to continue from. Runs which completed,
+        failed or were aborted are not resumed. """
+        q = db.session.query(cls).filter_by(operation=operation,
+                                            source_id=source.id)
+        run = q.order_by(cls.time_start.desc(), cls.id.desc()).first()
+        if run is None or run.status != cls.STATUS_RUNNING or \
+                not run.checkpoint:
+            return None
+        return run
+
     def __repr__(self):
         return "<Run(%s,%s)>" % (self.source.id, self.id)
 
@@ -1,5 +1,7 @@
 import logging
 from celery.task import task
+from paste.deploy.converters import asbool
+from pylons import config
 
 import openspending.command.celery
 
@@ -31,7 +33,7 @@ def analyze_source(source_id):
     db.session.commit()
 
 @task(ignore_result=True)
-def load_source(source_id, sample=False):
+def load_source(source_id, sample=False, resume=False):
     from openspending.model import Source
     from openspending.importer import CSVImporter
     source = Source.by_id(source_id)
@@ -47,8 +49,19 @@ def load_source(source_id, sample=False):
     if sample:
         importer.run(max_lines=1000, max_errors=1000)
     else:
-        importer.run()
-    index_dataset.delay(source.dataset.name)
+        build_rollups = asbool(config.get('openspending.rollups_enabled',
+                                          False))
+        workers = config.get('openspending.import.workers')
+        max_errors = config.get('openspending.import.max_errors')
+        max_error_rate = config.get('openspending.import.max_error_rate')
+        importer.run(build_rollups=build_rollups, resume=resume,
+                     workers=int(workers) if workers else None,
+                     max_errors=int(max_errors) if max_errors else None,
+                     max_error_rate=float(max_error_rate) \
+                             if max_error_rate else None)
+    index_run.delay(importer.run_id)
+    warm_cache.delay(source.dataset.name)
+    dump_dataset.delay(source.dataset.name)
 
 
 @task(ignore_result=True)
@@ -56,4 +69,40 @@ def index_dataset(dataset_name):
     from openspending.lib.solr_util import build_index
     build_index(dataset_name)
 
+@task(ignore_result=True)
+def index_run(run_id):
+    from openspending.model import Run
+    from openspending.lib import solr_util
+    run = Run.by_id(run_id)
+    if not run:
+        log.error("No such run: %s", run_id)
+        return
+    solr_util.index_run(run)
+
+@task(ignore_result=True)
+def warm_cache(dataset_name):
+    from openspending.model import Dataset
+    from openspending.ui.lib.cache import AggregationCache
+    from openspending.ui.lib import views
+    dataset = Dataset.by_name(dataset_name)
+    if dataset is None:
+        log.error("No such dataset: %s", dataset_name)
+        return
+    cache = AggregationCache(dataset)
+    if not cache.cache_enabled:
+        return
+    # Drop the aggregates of earlier data versions.
+    cache.invalidate()
+    num = views.warm_cache(dataset)
+    log.info("Pre-computed %s aggregates for: %s", num, dataset_name)
 
+@task(ignore_result=True)
+def dump_dataset(dataset_name):
+    from openspending.model import Dataset
+    from openspending.ui.lib import dump
+    dataset = Dataset.by_name(dataset_name)
+    if dataset is None:
+        log.error("No such dataset: %s", dataset_name)
+        return
+    for format in dump.FORMATS:
+        dump.build_dump(dataset, format)
@@ -2,7 +2,7 @@ from os.path import dirname, join
 from StringIO import StringIO
 from urlparse import urlunparse
 
-from openspending.model import Dataset, Source
+from openspending.model import Dataset, Source, Run, LogRecord
 from openspending.model import meta as db
 from openspending.lib import json
 
@@ -58,6 +58,119 @@ class TestCSVImporter(DatabaseTestCase):
                       "Entry with name could not be found")
         h.assert_equal(entry['amount'], 66097.77)
 
+    def test_successful_import_batched(self):
+        source = csvimport_fixture('successful_import')
+        importer = CSVImporter(source)
+        importer.run(batch_size=3)
+        h.assert_equal(importer.errors, 0)
+        dataset = db.session.query(Dataset).first()
+        h.assert_equal(len(list(dataset.entries())), 4)
+        h.assert_equal(dataset.num_entries, 4)
+        h.assert_equal(len(dataset), 4)
+
+    def test_failing_batch(self):
+        source = csvimport_fixture('successful_import')
+        importer = CSVImporter(source)
+        dataset, calls = importer.dataset, []
+        load = dataset.load
+
+        def load_batch(rows):
+            raise ValueError("Batch failed")
+
+        def load_row(data):
+            calls.append(data)
+            if len(calls) == 2:
+                raise ValueError("Row failed")
+            return load(data)
+
+        dataset.load_batch, dataset.load = load_batch, load_row
+        importer.run(batch_size=3)
+        h.assert_equal(len(calls), 4)
+        h.assert_equal(importer.errors, 1)
+        h.assert_equal(importer.failed_rows, 1)
+        records = list(importer._run.records)
+        h.assert_equal(records[0].row, 2)
+        h.assert_equal(records[0].message, "Row failed")
+        h.assert_equal(len(list(dataset.entries())), 3)
+        h.assert_equal(dataset.num_entries, 3)
+
+    def test_successful_import_parallel(self):
+        source = csvimport_fixture('successful_import')
+        importer = CSVImporter(source)
+        importer.run(workers=2)
+        h.assert_equal(importer.errors, 0)
+        dataset = db.session.query(Dataset).first()
+        h.assert_equal(len(list(dataset.entries())), 4)
+
+    def test_run_entries(self):
+        source = csvimport_fixture('successful_import')
+        importer = CSVImporter(source)
+        importer.run(batch_size=3)
+        run = Run.by_id(importer.run_id)
+        # the first import is indexed as a whole:
+        assert run.index_all
+        h.assert_equal(list(run.entry_ids()), [])
+
+        importer = CSVImporter(source)
+        importer.run(batch_size=3)
+        dataset = db.session.query(Dataset).first()
+        run = Run.by_id(importer.run_id)
+        assert not run.index_all
+        h.assert_equal(run.count_entries(), 4)
+        entry_ids = sorted([e['id'] for e in dataset.entries()])
+        h.assert_equal(sorted(run.entry_ids()), entry_ids)
+        run.clear_entries()
+        h.assert_equal(list(run.entry_ids()), [])
+
+    @h.patch('openspending.importer.CHECKPOINT_INTERVAL', 2)
+    def test_resume(self):
+        class InterruptedImporter(CSVImporter):
+            def process_result(self, *args, **kwargs):
+                if self.row_number == 3:
+                    # e.g. the worker process is shut down
+                    raise KeyboardInterrupt()
+                return CSVImporter.process_result(self, *args, **kwargs)
+
+        source = csvimport_fixture('successful_import')
+        importer = InterruptedImporter(source)
+        h.assert_raises(KeyboardInterrupt, importer.run)
+        run = Run.by_id(importer.run_id)
+        h.assert_equal(run.status, Run.STATUS_RUNNING)
+        h.assert_equal(run.checkpoint, 2)
+        dataset = db.session.query(Dataset).first()
+        h.assert_equal(len(list(dataset.entries())), 2)
+
+        importer = CSVImporter(source)
+        importer.run(resume=True)
+        h.assert_equal(importer.run_id, run.id)
+        run = Run.by_id(importer.run_id)
+        h.assert_equal(run.checkpoint, 4)
+        h.assert_equal(run.status, Run.STATUS_COMPLETE)
+        h.assert_equal(len(list(dataset.entries())), 4)
+        h.assert_equal(dataset.num_entries, 4)
+        assert run.index_all
+
+    @h.patch('openspending.importer.CHECKPOINT_INTERVAL', 2)
+    def test_no_resume_after_failure(self):
+        class FailingImporter(CSVImporter):
+            def process_result(self, *args, **kwargs):
+                if self.row_number == 3:
+                    raise RuntimeError("Broken")
+                return CSVImporter.process_result(self, *args, **kwargs)
+
+        source = csvimport_fixture('successful_import')
+        importer = FailingImporter(source)
+        h.assert_raises(RuntimeError, importer.run, raise_errors=True)
+        run = Run.by_id(importer.run_id)
+        h.assert_equal(run.status, Run.STATUS_FAILED)
+        h.assert_equal(run.checkpoint, 2)
+        assert Run.resumable('import', source) is None
+
+        importer = CSVImporter(source)
+        importer.run(resume=True)
+        assert importer.run_id != run.id
+        h.assert_equal(importer.row_number, 4)
+
     def test_no_dimensions_for_measures(self):
         source = csvimport_fixture('simple')
         importer = CSVImporter(source)
@@ -123,6 +236,62 @@ class TestCSVImporter(DatabaseTestCase):
                       "Should find badly formatted date")
         h.assert_equal(records[1].row, 5)
 
+    def test_erroneous_values_parallel(self):
+        source = csvimport_fixture('erroneous_values')
+        importer = CSVImporter(source)
+        importer.run(dry_run=True, workers=2)
+        h.assert_equal(importer.errors, 2)
+        records = list(importer._run.records)
+        h.assert_true("time" in records[1].attribute,
+                      "Should find badly formatted date")
+        h.assert_equal(records[1].row, 5)
+
+    @h.patch('openspending.importer.MAX_ERROR_SAMPLES', 0)
+    def test_erroneous_values_summarized(self):
+        source = csvimport_fixture('erroneous_values')
+        importer = CSVImporter(source)
+        importer.run(dry_run=True)
+        h.assert_equal(importer.errors, 2)
+        records = list(importer._run.records)
+        h.assert_equal(len(records), 2)
+        for record in records:
+            h.assert_equal(record.row, None)
+            assert 'in 1 rows' in record.message, record.message
+
+    @h.patch('openspending.importer.MAX_ERROR_SAMPLES', 0)
+    def test_resume_error_counts(self):
+        class InterruptedImporter(CSVImporter):
+            def log_error_summary(self):
+                raise KeyboardInterrupt()
+
+        source = csvimport_fixture('erroneous_values')
+        importer = InterruptedImporter(source)
+        h.assert_raises(KeyboardInterrupt, importer.run)
+        run = Run.by_id(importer.run_id)
+        h.assert_equal(run.checkpoint, 5)
+        h.assert_equal(run.num_errors, 2)
+        h.assert_equal(run.failed_rows, importer.failed_rows)
+
+        importer = CSVImporter(source)
+        importer.run(resume=True)
+        h.assert_equal(importer.run_id, run.id)
+        h.assert_equal(importer.errors, 2)
+        h.assert_equal(importer.failed_rows, run.failed_rows)
+        records = list(Run.by_id(run.id).records)
+        h.assert_equal(len(records), 2)
+        for record in records:
+            assert 'in 1 rows' in record.message, record.message
+
+    def test_max_errors(self):
+        source = csvimport_fixture('erroneous_values')
+        importer = CSVImporter(source)
+        importer.run(dry_run=True, max_errors=0)
+        records = list(importer._run.records)
+        h.assert_equal(records[-1].category, LogRecord.CATEGORY_SYSTEM)
+        assert 'aborted' in records[-1].message, records[-1].message
+        h.assert_equal(records[-1].row, 5)
+        h.assert_equal(importer._run.status, Run.STATUS_FAILED)
+
     def test_error_with_empty_additional_date(self):
         source = csvimport_fixture('empty_additional_date')
         importer = CSVImporter(source)
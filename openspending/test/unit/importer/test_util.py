@@ -1,3 +1,8 @@
+import bz2
+import gzip
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
 from StringIO import StringIO
 
 from openspending.importer import util
@@ -12,3 +17,92 @@ def test_urlopen_lines(urlopen_mock):
 
     h.assert_equal(lines,
                    ["line one\n", "line two\n", "line three"])
+
+class TestOpenSource(TestCase):
+
+    DATA = "a,b\r\n1,2\n" * 1000
+
+    def setup(self):
+        self.tmpdir = mkdtemp()
+
+    def teardown(self):
+        rmtree(self.tmpdir)
+
+    def _write(self, name, opener=open):
+        path = join(self.tmpdir, name)
+        fh = opener(path, 'wb')
+        fh.write(self.DATA)
+        fh.close()
+        return path
+
+    def test_local_file(self):
+        path = self._write('data.csv')
+        reader = util.open_source(path)
+        assert isinstance(reader, util.FileReader), reader
+        h.assert_equal(''.join(reader), self.DATA)
+        reader.close()
+        reader = util.open_source('file://' + path)
+        h.assert_equal(reader.read(), self.DATA)
+        reader.close()
+
+    def test_empty_file(self):
+        path = join(self.tmpdir, 'empty.csv')
+        open(path, 'wb').close()
+        h.assert_equal(list(util.urlopen_lines(path)), [])
+
+    def test_gzip(self):
+        path = self._write('data.csv.gz', gzip.open)
+        reader = util.open_source(path)
+        h.assert_equal(reader.read(10), self.DATA[:10])
+        h.assert_equal(reader.read(), self.DATA[10:])
+        reader.close()
+
+    def test_bz2(self):
+        path = self._write('data.csv.bz2', bz2.BZ2File)
+        lines = list(util.urlopen_lines(path))
+        h.assert_equal(len(lines), 2000)
+        h.assert_equal(lines[:2], ["a,b\n", "1,2\n"])
+
+    def test_bz2_streams(self):
+        path = join(self.tmpdir, 'data.csv.bz2')
+        fh = open(path, 'wb')
+        fh.write(bz2.compress(self.DATA) + bz2.compress(self.DATA))
+        fh.close()
+        reader = util.open_source(path)
+        h.assert_equal(reader.read(), self.DATA * 2)
+        reader.close()
+
+    def test_streams_across_blocks(self):
+        for compression, compress in [('bz2', bz2.compress),
+                                      ('gzip', _gzip_compress)]:
+            blocks = [compress(self.DATA), compress(self.DATA)]
+            reader = util.DecompressingReader(blocks, compression)
+            h.assert_equal(reader.read(), self.DATA * 2)
+
+    def test_gzip_large(self):
+        data = self.DATA * 1000
+        path = join(self.tmpdir, 'data.csv.gz')
+        fh = gzip.open(path, 'wb')
+        fh.write(data)
+        fh.close()
+        reader = util.open_source(path)
+        chunks = []
+        while True:
+            chunk = reader.read(1000)
+            if not chunk:
+                break
+            # inflated data is bounded by the block size:
+            assert len(reader.buffer) <= reader.block_size, \
+                    len(reader.buffer)
+            chunks.append(chunk)
+        reader.close()
+        h.assert_equal(len(chunks), len(data) / 1000)
+        h.assert_equal(''.join(chunks), data)
+
+
+def _gzip_compress(data):
+    sio = StringIO()
+    fh = gzip.GzipFile(fileobj=sio, mode='wb')
+    fh.write(data)
+    fh.close()
+    return sio.getvalue()
@@ -21,3 +21,12 @@ def test_income_tax():
     # Mid-ranking incomes, requiring interpolation.
     yield test, 25837.04
 
+
+def test_total_taxes():
+    incomes = [0, 5225, 25837.04, 94341, 10e6]
+    results = calculator.total_taxes(incomes, is_smoker=False)
+    assert len(results) == len(incomes), results
+    for income, result in zip(incomes, results):
+        tax, explanation = calculator.total_tax(income, is_smoker=False)
+        assert result == tax, (income, result, tax)
+    assert results[2]['tobacco_tax'] == 0, results[2]
@@ -0,0 +1,44 @@
+import csv
+from StringIO import StringIO
+
+from openspending.lib import csvexport
+from openspending.model import Dataset
+
+from ... import DatabaseTestCase, helpers as h
+
+class TestCSVExport(DatabaseTestCase):
+
+    def setup(self):
+        super(TestCSVExport, self).setup()
+        h.load_fixture('cra')
+        self.dataset = Dataset.by_name('cra')
+
+    def test_entry_fields(self):
+        fields = csvexport.entry_fields(self.dataset)
+        assert 'id' in fields, fields
+        assert 'amount' in fields, fields
+        assert 'cofog1.label' in fields, fields
+        assert 'time.year' in fields, fields
+        h.assert_equal(fields, sorted(fields))
+
+    def test_generate_csv(self):
+        fields = csvexport.entry_fields(self.dataset)
+        data = ''.join(csvexport.generate_csv(self.dataset.entries(),
+                                              fields=fields))
+        rows = list(csv.DictReader(StringIO(data)))
+        h.assert_equal(len(rows), 36)
+        h.assert_equal(sorted(rows[0].keys()), fields)
+
+    def test_generate_csv_chunks(self):
+        chunk_size = csvexport.CHUNK_SIZE
+        csvexport.CHUNK_SIZE = 1000
+        try:
+            chunks = list(csvexport.generate_csv(self.dataset.entries()))
+        finally:
+            csvexport.CHUNK_SIZE = chunk_size
+        assert len(chunks) > 1, len(chunks)
+        rows = list(csv.DictReader(StringIO(''.join(chunks))))
+        h.assert_equal(len(rows), 36)
+
+    def test_generate_csv_empty(self):
+        h.assert_equal(list(csvexport.generate_csv([])), [])
@@ -0,0 +1,28 @@
+from openspending.lib import json
+from openspending.lib import jsonexport
+
+from ... import helpers as h
+
+def test_to_json_compact():
+    data = {'a': [1, 2], 'b': {'c': 'd'}}
+    assert '\n' not in jsonexport.to_json(data)
+    assert ' ' not in jsonexport.to_json(data)
+    assert '\n' in jsonexport.to_json(data, indent=2)
+    h.assert_equal(json.loads(jsonexport.to_json(data)), data)
+
+def test_generate_browser_json():
+    rows = [{'id': i, 'label': 'x' * 100} for i in range(100)]
+    chunk_size = jsonexport.CHUNK_SIZE
+    jsonexport.CHUNK_SIZE = 1000
+    try:
+        chunks = list(jsonexport.generate_browser_json(rows, {}, {}, None))
+    finally:
+        jsonexport.CHUNK_SIZE = chunk_size
+    assert 1 < len(chunks) < 20, len(chunks)
+    data = json.loads(''.join(chunks))
+    h.assert_equal(data['results'], rows)
+
+def test_generate_browser_json_callback():
+    chunks = list(jsonexport.generate_browser_json([], {}, {}, 'cb'))
+    h.assert_equal(''.join(chunks),
+                   'cb({"stats":{},"facets":{},"results":[]})')
@@ -0,0 +1,25 @@
+from openspending.lib.lru import LRUCache
+
+from ... import helpers as h
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache['a'] = 1
+    cache['b'] = 2
+    h.assert_equal(cache.get('a'), 1)
+    cache['c'] = 3
+    h.assert_equal(len(cache), 2)
+    h.assert_true('a' in cache)
+    h.assert_false('b' in cache)
+    h.assert_equal(cache.evictions, 1)
+
+def test_lru_counts_hits_and_misses():
+    cache = LRUCache(2)
+    cache['a'] = 1
+    cache.get('a')
+    cache.get('a')
+    h.assert_equal(cache.get('b', 'default'), 'default')
+    stats = cache.stats()
+    h.assert_equal(stats['hits'], 2)
+    h.assert_equal(stats['misses'], 1)
+    h.assert_equal(stats['size'], 1)
@@ -1,4 +1,5 @@
 from openspending.lib import solr_util as solr
+from openspending.model import Dataset, Run, meta as db
 
 from ... import DatabaseTestCase, helpers as h
 
@@ -48,3 +49,54 @@ class TestSearch(DatabaseTestCase):
         timeamount = amount['facets']['time']['2007-01-01']
         assert timeamount['sum'] == -20300000.0, timeamount['sum']
         assert timeamount['mean'] == -4060000.0, timeamount['mean']
+
+
+class TestBuildIndex(DatabaseTestCase):
+
+    def setup(self):
+        super(TestBuildIndex, self).setup()
+        h.load_fixture('cra')
+        h.clean_solr()
+
+    def test_build_index(self):
+        solr.build_index('cra', batch_size=10, workers=2, senders=3)
+        conn = solr.get_connection()
+        if isinstance(conn, solr._Stub):
+            docs = [d for d in conn.records if d['dataset'] == 'cra']
+            assert len(docs) == 36, len(docs)
+            assert len(set([d['_id'] for d in docs])) == 36, docs
+        else:
+            query = conn.query('dataset:cra', rows=0)
+            assert query.numFound == 36, query.numFound
+
+    def test_update_index(self):
+        dataset = Dataset.by_name('cra')
+        entry_ids = [e['id'] for e in dataset.entries(limit=5)]
+        solr.update_index('cra', entry_ids + ['no-such-entry'], batch_size=2)
+        conn = solr.get_connection()
+        if isinstance(conn, solr._Stub):
+            docs = [d for d in conn.records if d['dataset'] == 'cra']
+            assert len(docs) == 5, len(docs)
+            solr.build_index('cra')
+            dataset.flush()
+            solr.update_index('cra', entry_ids)
+            docs = [d for d in conn.records if d['dataset'] == 'cra']
+            assert len(docs) == 31, len(docs)
+
+    def test_index_run(self):
+        dataset = Dataset.by_name('cra')
+        run = Run('import', Run.STATUS_COMPLETE, dataset, None)
+        db.session.add(run)
+        db.session.commit()
+        run.record_entries([e['id'] for e in dataset.entries(limit=5)])
+        solr.index_run(run)
+        h.assert_equal(run.count_entries(), 0)
+        conn = solr.get_connection()
+        if isinstance(conn, solr._Stub):
+            docs = [d for d in conn.records if d['dataset'] == 'cra']
+            assert len(docs) == 5, len(docs)
+            run.index_all = True
+            solr.index_run(run)
+            ids = set([d['_id'] for d in conn.records
+                       if d['dataset'] == 'cra'])
+            assert len(ids) == 36, len(ids)
@@ -11,3 +11,16 @@ def test_slugify():
 
 def test_hash_values():
     util.hash_values([u'fóo&bañ'])
+
+def test_process_pool():
+    assert util.process_pool(1) is None
+    pool = util.process_pool(2)
+    try:
+        h.assert_equal(pool.apply(abs, (-1,)), 1)
+    finally:
+        pool.terminate()
+
+@h.patch('openspending.lib.util.current_process')
+def test_process_pool_daemon(current_process):
+    current_process.return_value.daemon = True
+    assert util.process_pool(2) is None
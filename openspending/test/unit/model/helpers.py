@@ -60,13 +60,15 @@ TEST_DATA="""year,amount,field,to_name,to_label,func_name,func_label
 """
 
 def load_dataset(dataset):
+    for row in simple_rows():
+        dataset.load(row)
+
+def simple_rows():
     from StringIO import StringIO
     import csv
     from openspending.validation.data import convert_types
     reader = csv.DictReader(StringIO(TEST_DATA))
-    for row in reader:
-        row = convert_types(SIMPLE_MODEL['mapping'], row)
-        dataset.load(row)
+    return [convert_types(SIMPLE_MODEL['mapping'], row) for row in reader]
 
 #def make_test_app(use_cookies=False):
 #    web.app.config['TESTING'] = True
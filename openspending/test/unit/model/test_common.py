@@ -0,0 +1,20 @@
+from openspending.test import TestCase, helpers as h
+
+from openspending.model.common import copy_data
+
+class TestCopyData(TestCase):
+
+    def test_null(self):
+        rows = [{'id': 'a', 'amount': None, 'to_id': None}]
+        data = copy_data(['id', 'amount', 'to_id'], rows)
+        h.assert_equal(data, '"a",\\N,\\N\n')
+
+    def test_quoting(self):
+        rows = [{'id': u'say "hi"', 'amount': 1000, 'share': 0.5},
+                {'id': u'', 'amount': 10L, 'share': None}]
+        data = copy_data(['id', 'amount', 'share'], rows)
+        h.assert_equal(data, '"say ""hi""",1000,0.5\n"",10,\\N\n')
+
+    def test_unicode(self):
+        rows = [{'id': u'\u2603'}]
+        h.assert_equal(copy_data(['id'], rows), '"\xe2\x98\x83"\n')
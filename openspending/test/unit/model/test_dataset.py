@@ -3,7 +3,8 @@
 from sqlalchemy import Integer, UnicodeText, Float, Unicode
 from nose.tools import assert_raises
 
-from openspending.test.unit.model.helpers import SIMPLE_MODEL, load_dataset
+from openspending.test.unit.model.helpers import SIMPLE_MODEL, \
+        load_dataset, simple_rows
 from openspending.test import DatabaseTestCase, helpers as h
 
 from openspending.model import meta as db
@@ -34,6 +35,23 @@ class TestDataset(DatabaseTestCase):
         assert len(self.ds.measures)==1,self.ds.measures
         assert isinstance(self.ds['amount'], Measure), self.ds['amount']
 
+    def test_field_lookup(self):
+        for field in self.ds.fields:
+            assert self.ds[field.name] is field, field
+        assert_raises(KeyError, self.ds.__getitem__, 'foo')
+
+    def test_column_decoder(self):
+        decoder = self.ds._column_decoder(['entry_id', 'function_label',
+                                           'field_field', 'entries'])
+        h.assert_equal(decoder, [(None, 'id', None),
+                                 ('function', 'label', 'funny'),
+                                 ('field', 'field', None),
+                                 (None, 'num_entries', None)])
+        row = self.ds._decode_row(decoder, ['x', 'Foo', 'bar', 3])
+        h.assert_equal(row, {'id': 'x', 'function': {'label': 'Foo',
+                                                     'taxonomy': 'funny'},
+                             'field': {'field': 'bar'}, 'num_entries': 3})
+
     def test_value_dimensions_as_attributes(self):
         dim = self.ds['field']
         assert isinstance(dim.column.type, UnicodeText), dim.column
@@ -86,6 +104,19 @@ class TestDatasetLoad(DatabaseTestCase):
         assert row0['amount']==200, row0.items()
         assert row0['field']=='foo', row0.items()
     
+    def test_load_batch(self):
+        ids, created = self.ds.load_batch(simple_rows())
+        h.assert_equal(ids, [self.ds.make_key(r) for r in simple_rows()])
+        h.assert_equal(created, 6)
+        resn = self.engine.execute(self.ds.table.select()).fetchall()
+        assert len(resn)==6,resn
+        rows = simple_rows()
+        rows[0]['amount'] = 4711.0
+        h.assert_equal(self.ds.load_batch(rows), (ids, 0))
+        resn = self.engine.execute(self.ds.table.select()).fetchall()
+        assert len(resn)==6,resn
+        assert 4711.0 in [r['amount'] for r in resn], resn
+
     def test_flush(self):
         load_dataset(self.ds)
         resn = self.engine.execute(self.ds.table.select()).fetchall()
@@ -142,6 +173,133 @@ class TestDatasetLoad(DatabaseTestCase):
         assert res['summary']['amount']==2690, res
         assert len(res['drilldown'])==5, res['drilldown']
     
+    def test_aggregate_paged(self):
+        load_dataset(self.ds)
+        full = self.ds.aggregate(drilldowns=['function', 'field'])
+        res = self.ds.aggregate(drilldowns=['function', 'field'],
+                                page=2, pagesize=2)
+        assert len(res['drilldown'])==2, res['drilldown']
+        assert res['drilldown']==full['drilldown'][2:4], res['drilldown']
+        assert res['summary']['num_entries']==6, res
+        assert res['summary']['amount']==2690, res
+        assert res['summary']['num_drilldowns']==5, res
+        assert res['summary']['pages']==3, res
+
+    def test_aggregate_paged_ties(self):
+        load_dataset(self.ds)
+        full = self.ds.aggregate(drilldowns=['year', 'field'],
+                                 order=[('year', False)])
+        cells = []
+        for page in range(1, full['summary']['num_drilldowns'] + 1):
+            res = self.ds.aggregate(drilldowns=['year', 'field'],
+                                    order=[('year', False)],
+                                    page=page, pagesize=1)
+            cells.extend(res['drilldown'])
+        h.assert_equal(cells, full['drilldown'])
+
+    def test_aggregate_rollups(self):
+        load_dataset(self.ds)
+        queries = [{},
+                   {'drilldowns': ['year']},
+                   {'drilldowns': ['function'], 'cuts': [('year', u'2010')]},
+                   {'drilldowns': ['to.label', 'year'],
+                    'order': [('year', False)]}]
+        expected = [self.ds.aggregate(**q) for q in queries]
+        self.ds.build_rollups()
+        assert self.ds.rollup_for([]).name=='year'
+        assert self.ds.rollup_for(['year', 'to.label']).name=='to'
+        assert self.ds.rollup_for(['field']) is None
+        for q, e in zip(queries, expected):
+            res = self.ds.aggregate(**q)
+            assert res['summary']==e['summary'], (res, e)
+            key = lambda c: repr(sorted(c.items()))
+            assert sorted(res['drilldown'], key=key)== \
+                    sorted(e['drilldown'], key=key), (res, e)
+
+    def test_num_entries(self):
+        db.session.add(self.ds)
+        db.session.commit()
+        h.assert_equal(self.ds.num_entries, 0)
+        _, created = self.ds.load(simple_rows()[0])
+        assert created
+        self.ds.add_entries(created)
+        h.assert_equal(self.ds.num_entries, 1)
+        _, created = self.ds.load_batch(simple_rows())
+        h.assert_equal(created, 5)
+        self.ds.add_entries(created)
+        h.assert_equal(self.ds.num_entries, 6)
+        db.session.commit()
+        db.session.remove()
+        ds = Dataset.by_name('test')
+        h.assert_equal(ds.entry_count, 6)
+        ds.flush()
+        h.assert_equal(ds.num_entries, 0)
+        ds.add_entries(ds.load_batch(simple_rows()[:4])[1])
+        h.assert_equal(ds.num_entries, 4)
+        h.assert_equal(len(ds), 4)
+
+    def test_len_is_read_only(self):
+        db.session.add(self.ds)
+        db.session.commit()
+        load_dataset(self.ds)
+        h.assert_equal(self.ds.num_entries, 6)
+        self.ds.add_entries(1)
+        updated_at = self.ds.updated_at
+        # counting entries does not touch the metadata:
+        assert updated_at is None, updated_at
+        h.assert_equal(len(self.ds), 6)
+        assert self.ds
+        h.assert_equal(self.ds.entry_count, 7)
+        db.session.expire(self.ds)
+        h.assert_equal(self.ds.entry_count, 7)
+        h.assert_equal(self.ds.updated_at, updated_at)
+
+    def test_load_drops_rollups(self):
+        load_dataset(self.ds)
+        self.ds.build_rollups()
+        assert 'test__rollup__to' in self.engine.table_names()
+        load_dataset(self.ds)
+        assert self.ds.rollup_for([]) is None
+        assert 'test__rollup__to' not in self.engine.table_names()
+
+    def test_data_version(self):
+        db.session.add(self.ds)
+        db.session.commit()
+        version = self.ds.data_version
+        load_dataset(self.ds)
+        assert self.ds.data_version==version+1, self.ds.data_version
+        db.session.commit()
+        self.ds.flush()
+        assert self.ds.data_version==version+2, self.ds.data_version
+
+    def test_model_cache(self):
+        db.session.add(self.ds)
+        db.session.commit()
+        db.session.remove()
+        first = Dataset.by_name('test')
+        db.session.remove()
+        second = Dataset.by_name('test')
+        assert second is not first
+        assert second.table is first.table, second.table
+        assert second['to'] is first['to'], second['to']
+
+        load_dataset(second)
+        assert len(second['to']._pk_cache), second['to']._pk_cache
+        db.session.commit()
+        db.session.remove()
+        third = Dataset.by_name('test')
+        assert third.table is second.table, third.table
+        assert not len(third['to']._pk_cache), third['to']._pk_cache
+
+        mapping = dict(third.mapping)
+        del mapping['field']
+        third.data = dict(third.data, mapping=mapping)
+        db.session.commit()
+        db.session.remove()
+        fourth = Dataset.by_name('test')
+        assert fourth.table is not third.table, fourth.table
+        assert 'field' not in fourth.table.c, fourth.table.c
+
     def test_aggregate_by_attribute(self):
         load_dataset(self.ds)
         res = self.ds.aggregate(drilldowns=['function.label'])
@@ -161,3 +319,15 @@ class TestDatasetLoad(DatabaseTestCase):
         assert isinstance(row['field'], unicode), row
         assert isinstance(row['function'], dict), row
         assert isinstance(row['to'], dict), row
+
+    def test_entries_paged(self):
+        load_dataset(self.ds)
+        ids = [e['id'] for e in self.ds.entries()]
+        paged = [e['id'] for e in self.ds.entries(step=4)]
+        assert paged==ids, (paged, ids)
+        assert paged==sorted(paged), paged
+        paged = [e['id'] for e in self.ds.entries(step=2, offset=1, limit=3)]
+        assert paged==ids[1:4], (paged, ids)
+        cond = self.ds.alias.c.field==u'foo'
+        paged = [e['id'] for e in self.ds.entries(cond, step=1)]
+        assert len(paged)==3, paged
@@ -47,3 +47,39 @@ class TestCompoundDimension(DatabaseTestCase):
         assert 'name' in self.entity.table.c, self.entity.table.c
         assert 'label' in self.entity.table.c, self.entity.table.c
 
+
+class TestCompoundDimensionLoad(DatabaseTestCase):
+
+    def setup(self):
+        super(TestCompoundDimensionLoad, self).setup()
+        self.ds = Dataset(SIMPLE_MODEL)
+        self.ds.generate()
+        self.entity = self.ds['to']
+
+    def test_pk_cache(self):
+        load_dataset(self.ds)
+        stats = self.entity._pk_cache.stats()
+        assert stats['size']==3, stats
+        assert stats['misses']==3, stats
+        assert stats['hits']==3, stats
+
+    def test_preload(self):
+        load_dataset(self.ds)
+        ds = Dataset(SIMPLE_MODEL)
+        ds.preload()
+        cache = ds['to']._pk_cache
+        assert len(cache)==3, cache.stats()
+        load_dataset(ds)
+        assert cache.misses==0, cache.stats()
+
+    def test_date_dimension_memoized(self):
+        load_dataset(self.ds)
+        cache = self.ds['time']._date_cache
+        assert len(cache)==2, cache.stats()
+        assert cache.hits==4, cache.stats()
+        assert self.ds['time']._pk_cache.hits==0, cache.stats()
+
+    def test_flush_clears_pk_cache(self):
+        load_dataset(self.ds)
+        self.ds.flush()
+        assert len(self.entity._pk_cache)==0, self.entity._pk_cache.stats()
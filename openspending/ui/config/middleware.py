@@ -26,6 +26,7 @@ from openspending.plugins import core as plugins
 from openspending.plugins.interfaces import IMiddleware
 
 from openspending.ui.config.environment import load_environment
+from openspending.ui.lib.compress import GzipMiddleware
 from openspending.ui.lib.authenticator import (UsernamePasswordAuthenticator,
                                                ApiKeyAuthenticator)
 
@@ -117,6 +118,12 @@ def make_app(global_conf, full_stack=True, static_files=True, **app_conf):
         static_parsers = [static_app, app]
         app = Cascade(static_parsers)
 
+    # Compress large responses (outermost, since the body of streamed
+    # responses is only produced once the server iterates over it)
+    if asbool(config.get('openspending.gzip_enabled', True)):
+        threshold = int(config.get('openspending.gzip_threshold', 1024))
+        app = GzipMiddleware(app, threshold=threshold)
+
     # Plugin middleware
     for plugin in plugins.PluginImplementations(IMiddleware):
         app = plugin.setup_middleware(app)
@@ -65,6 +65,7 @@ def make_map():
     map.connect('/api/search', controller='api', action='search')
     map.connect('/api/aggregate', controller='api', action='aggregate')
     map.connect('/api/mytax', controller='api', action='mytax')
+    map.connect('/api/mytax/batch', controller='api', action='mytax_batch')
 
     map.connect('/api/rest/', controller='rest', action='index')
     map.connect('/api/2/aggregate', controller='api2', action='aggregate')
@@ -13,6 +13,13 @@ from openspending.lib.jsonexport import jsonpify
 
 log = logging.getLogger(__name__)
 
+# Maximum number of incomes in a single mytax_batch request.
+MAX_INCOMES = 1000
+
+# The calculator precomputes its tables once; it is not changed by the
+# calculations, so all requests share it.
+tax_calculator = calculator.TaxCalculator2010()
+
 def statistic_normalize(dataset, result, per, statistic):
     drilldowns = []
     values = {}
@@ -31,6 +38,34 @@ def statistic_normalize(dataset, result, per, statistic):
     result['drilldown'] = drilldowns
     return result
 
+def float_param(name, required=False):
+    if name not in request.params:
+        if required:
+            abort(status_code=400,
+                  detail='parameter %s is missing' % name)
+        return None
+    ans = request.params[name]
+    try:
+        return float(ans)
+    except ValueError:
+        abort(status_code=400, detail='%r is not a number' % ans)
+
+def bool_param(name, default=True, required=False):
+    if name not in request.params:
+        if required:
+            abort(status_code=400,
+                  detail='parameter %s is missing' % name)
+        return default
+
+    ans = request.params[name].lower()
+    if ans == 'yes':
+        return True
+    elif ans == 'no':
+        return False
+    else:
+        abort(status_code=400,
+              detail='%r is not %r or %r' % (ans, 'yes', 'no'))
+
 def cellget(cell, key):
     val = cell.get(key)
     if isinstance(val, dict):
@@ -121,36 +156,7 @@ class ApiController(BaseController):
 
     @jsonpify
     def mytax(self):
-
-        def float_param(name, required=False):
-            if name not in request.params:
-                if required:
-                    abort(status_code=400,
-                          detail='parameter %s is missing' % name)
-                return None
-            ans = request.params[name]
-            try:
-                return float(ans)
-            except ValueError:
-                abort(status_code=400, detail='%r is not a number' % ans)
-
-        def bool_param(name, default=True, required=False):
-            if name not in request.params:
-                if required:
-                    abort(status_code=400,
-                          detail='parameter %s is missing' % name)
-                return default
-
-            ans = request.params[name].lower()
-            if ans == 'yes':
-                return True
-            elif ans == 'no':
-                return False
-            else:
-                abort(status_code=400,
-                      detail='%r is not %r or %r' % (ans, 'yes', 'no'))
-
-        tax, explanation = calculator.TaxCalculator2010().total_tax(
+        tax, explanation = tax_calculator.total_tax(
             float_param('income', required=True),
             float_param('spending'),
             bool_param('smoker'),
@@ -162,3 +168,30 @@ class ApiController(BaseController):
             result[k] = v
 
         return result
+
+    @jsonpify
+    def mytax_batch(self):
+        """ Calculate the tax for many incomes at once, given as a
+        comma-separated list in ``incomes``. """
+        if 'incomes' not in request.params:
+            abort(status_code=400, detail='parameter incomes is missing')
+        incomes = request.params['incomes'].split(',')
+        if len(incomes) > MAX_INCOMES:
+            abort(status_code=400, detail='at most %s incomes are ' \
+                  'supported' % MAX_INCOMES)
+        try:
+            incomes = map(float, incomes)
+        except ValueError:
+            abort(status_code=400, detail='%r are not numbers' % \
+                  request.params['incomes'])
+
+        taxes = tax_calculator.total_taxes(incomes,
+            bool_param('smoker'),
+            bool_param('drinker'),
+            bool_param('driver'))
+
+        results = []
+        for income, tax in zip(incomes, taxes):
+            tax['income'] = income
+            results.append(tax)
+        return {'results': results}
@@ -31,17 +31,21 @@ class Api2Controller(BaseController):
 
         try:
             cache = AggregationCache(dataset)
-            result = cache.aggregate(measure=measure, 
-                                     drilldowns=drilldowns, 
-                                     cuts=cuts, page=page, 
-                                     pagesize=pagesize, order=order)
-
-            if cache.cache_enabled and 'cache_key' in result['summary']:
+            if cache.cache_enabled:
+                # The key changes with the data of the dataset, so a
+                # client's copy can be validated before aggregating.
+                key = cache.key(measure=measure, drilldowns=drilldowns,
+                                cuts=cuts, page=page, pagesize=pagesize,
+                                order=order)
                 if 'Pragma' in response.headers:
                     del response.headers['Pragma']
                 response.cache_control = 'public; max-age: 84600'
-                etag_cache(result['summary']['cache_key'])
+                etag_cache(key)
 
+            result = cache.aggregate(measure=measure, 
+                                     drilldowns=drilldowns, 
+                                     cuts=cuts, page=page, 
+                                     pagesize=pagesize, order=order)
         except (KeyError, ValueError) as ve:
             log.exception(ve)
             return {'errors': ['Invalid aggregation query: %r' % ve]}
@@ -108,7 +108,7 @@ class DatasetController(BaseController):
 
     def view(self, dataset, format='html'):
         self._get_dataset(dataset)
-        c.num_entries = len(c.dataset)
+        c.num_entries = c.dataset.num_entries
 
         handle_request(request, c, c.dataset)
 
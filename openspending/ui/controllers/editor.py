@@ -28,7 +28,7 @@ class EditorController(BaseController):
     def index(self, dataset, format='html'):
         self._get_dataset(dataset)
         require.dataset.update(c.dataset)
-        c.entries_count = len(c.dataset)
+        c.entries_count = c.dataset.num_entries
         c.has_sources = c.dataset.sources.count() > 0
         c.source = c.dataset.sources.first()
         c.index_count = solr.dataset_entries(c.dataset.name)
@@ -88,7 +88,7 @@ class EditorController(BaseController):
         c.fill = {'mapping': json.dumps(mapping, indent=2)}
         c.errors = errors
         c.saved = saved
-        if len(c.dataset):
+        if c.dataset.num_entries:
             return render('editor/dimensions_errors.html')
         return render('editor/dimensions.html', form_fill=c.fill)
     
@@ -109,7 +109,7 @@ class EditorController(BaseController):
             new_mapping =  schema.deserialize(mapping)
             c.dataset.data['mapping'] = new_mapping
             c.dataset.drop()
-            c.dataset._load_model()
+            c.dataset.reload_model()
             c.dataset.generate()
             db.session.commit()
             #h.flash_success(_("The mapping has been updated."))
@@ -9,6 +9,8 @@ from openspending.plugins.interfaces import IEntryController
 from openspending.ui.lib.base import BaseController, render
 from openspending.ui.lib.views import handle_request
 from openspending.ui.lib.browser import Browser
+from openspending.ui.lib.compress import accepted_encoding
+from openspending.ui.lib.dump import generate_dump
 from openspending.lib.csvexport import write_csv
 from openspending.lib.jsonexport import to_jsonp
 from openspending.ui.lib import helpers as h
@@ -27,6 +29,8 @@ class EntryController(BaseController):
         c.browser = Browser(c.dataset, request.params, url=url)
         c.browser.facet_by_dimensions()
 
+        if format in ('json', 'csv') and c.browser.is_bulk(format):
+            return self._dump(format)
         if format == 'json':
             return c.browser.to_jsonp()
         elif format == 'csv':
@@ -35,6 +39,20 @@ class EntryController(BaseController):
         else:
             return render('entry/index.html')
 
+    def _dump(self, format):
+        """ Stream all entries of the dataset from its dump file. """
+        if format == 'csv':
+            response.content_type = 'text/csv'
+            response.content_disposition = 'attachment; filename=%s.csv' % c.dataset.name
+        else:
+            response.content_type = 'application/json'
+        response.headers['Vary'] = 'Accept-Encoding'
+        encoding = accepted_encoding(request.headers.get('Accept-Encoding'))
+        gzipped = encoding == 'gzip'
+        if gzipped:
+            response.headers['Content-Encoding'] = 'gzip'
+        return generate_dump(c.dataset, format, gzipped=gzipped)
+
     def view(self, dataset, id, format='html'):
         self._get_dataset(dataset)
         entries = list(c.dataset.entries(c.dataset.alias.c.id==id))
@@ -56,7 +74,7 @@ class EntryController(BaseController):
                          'to', 'dataset', 'id', 'name', 'description')
 
         c.extras = {}
-        if c.dataset:
+        if c.dataset is not None:
             c.desc = dict([(d.name, d) for d in c.dataset.dimensions])
             for key in c.entry:
                 if key in c.desc and \
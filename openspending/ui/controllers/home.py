@@ -31,7 +31,7 @@ class HomeController(BaseController):
         return render('home/getinvolved.html')
 
     def index_subdomain(self):
-        if hasattr(c, 'dataset') and c.dataset:
+        if hasattr(c, 'dataset') and c.dataset is not None:
             require.dataset.read(c.dataset)
             redirect(url(controller='dataset',
                          action='view',
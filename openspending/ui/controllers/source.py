@@ -64,7 +64,8 @@ class SourceController(BaseController):
         require.dataset.update(c.dataset)
         try:
             sample = asbool(request.params.get('sample', 'false'))
-            load_source.delay(c.source.id, sample)
+            resume = asbool(request.params.get('resume', 'false'))
+            load_source.delay(c.source.id, sample, resume)
         except Exception, e:
             abort(400, e)
 
@@ -122,9 +122,8 @@ class BaseController(WSGIController):
         if not '.' in http_host:
             return
         dataset_name, domain = http_host.split('.', 1)
-        for dataset in c.datasets:
-            if dataset.name.lower() == dataset_name:
-                c.dataset = dataset
+        name = db.func.lower(model.Dataset.name)
+        c.dataset = c.datasets.filter(name==dataset_name).first()
 
     def _detect_format(self, format):
         for mimetype, mimeformat in self.accept_mimetypes.items():
@@ -134,7 +133,9 @@ class BaseController(WSGIController):
         return "html"
        
     def _get_dataset(self, dataset):
-        c.dataset = model.Dataset.by_name(dataset)
+        # the dataset may already be known from the subdomain.
+        if c.dataset is None or c.dataset.name != dataset:
+            c.dataset = model.Dataset.by_name(dataset)
         if c.dataset is None:
             abort(404, _('Sorry, there is no dataset named %r') % dataset)
         require.dataset.read(c.dataset)
@@ -5,7 +5,7 @@ from pylons import response
 
 from openspending.lib import json
 from openspending.lib import solr_util as solr
-from openspending.lib.csvexport import write_csv
+from openspending.lib.csvexport import write_csv, entry_fields
 from openspending.lib.jsonexport import write_browser_json
 from openspending.ui.lib.page import Page
 
@@ -48,7 +48,7 @@ class Browser(object):
         # param, unless no such query param is set.
         try:
             self.limit = int(self.args.get('limit'))
-        except TypeError:
+        except (TypeError, ValueError):
             self.limit = limit
 
     def _set_page_number(self):
@@ -99,6 +99,18 @@ class Browser(object):
     def q(self):
         return self.args.get('q', '')
 
+    def is_bulk(self, format):
+        """ Check whether a request is for all entries of the dataset,
+        which can be exported without querying Solr. That is the case
+        for unfiltered CSV exports and unfiltered JSON requests with
+        ``limit=all``. """
+        if self.q or self.filters or self._filters:
+            return False
+        if format == 'csv':
+            return True
+        return format == 'json' and self.args.get('limit') == 'all' \
+                and 'callback' not in self.args
+
     @property
     def results(self):
         if self._results is None:
@@ -229,4 +241,5 @@ class Browser(object):
         return write_browser_json(self.entries, self.stats, facets, response)
 
     def to_csv(self):
-        return write_csv(self.all_entries, response)
+        return write_csv(self.all_entries, response,
+                         fields=entry_fields(self.dataset))
@@ -1,27 +1,437 @@
-from sys import maxint
-import math
 import hashlib
+from json import dumps
+from threading import Event, Lock
+from time import sleep, time
+import cPickle as pickle
 import logging
 
+from beaker.cache import CacheManager
+from beaker.util import parse_cache_config_options
 from paste.deploy.converters import asbool
 from pylons import cache, config
 
+from openspending.lib.lru import LRUCache
+
 log = logging.getLogger(__name__)
 
+_cache_manager = None
+
+def get_cache_manager():
+    """ Return the cache manager registered for the current request.
+    Outside of a request (e.g. in a background task), a cache manager
+    is created from the application configuration instead, so that
+    both share the same cache storage. """
+    global _cache_manager
+    try:
+        return cache._current_obj()
+    except TypeError:
+        if _cache_manager is None:
+            options = parse_cache_config_options(config)
+            _cache_manager = CacheManager(**options)
+        return _cache_manager
+
+
+class CacheBackend(object):
+    """ Storage for cached aggregation results. Entries are grouped
+    in namespaces (one per dataset) which can be cleared as a whole.
+    A ``ttl`` of 0 means that entries do not expire. """
+
+    name = None
+
+    def __init__(self, ttl=0):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, namespace, key):
+        """ Return the cached value or ``None``. """
+        value = self._get(namespace, key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def lock(self, namespace, key, timeout):
+        """ Try to take a lock on ``key`` which is shared with other
+        processes, expiring after ``timeout`` seconds. Backends which
+        are not shared always succeed. """
+        return True
+
+    def unlock(self, namespace, key):
+        pass
+
+    def stats(self):
+        return {'backend': self.name,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': 0}
+
+
+class DbmBackend(CacheBackend):
+    """ Beaker's file-based dbm cache, local to each host. """
+
+    name = 'dbm'
+
+    def _cache(self, namespace):
+        kw = {'expire': self.ttl} if self.ttl else {}
+        return get_cache_manager().get_cache(namespace, type='dbm', **kw)
+
+    def _get(self, namespace, key):
+        try:
+            return self._cache(namespace).get(key)
+        except KeyError:
+            return None
+
+    def put(self, namespace, key, value):
+        self._cache(namespace).put(key, value)
+
+    def clear(self, namespace):
+        self._cache(namespace).clear()
+
+
+class GenerationBackend(CacheBackend):
+    """ Base for key-value stores which cannot enumerate the keys of a
+    namespace. Each namespace has a generation number which is part of
+    all its keys, so clearing the namespace means incrementing the
+    generation; the orphaned entries are then evicted or expire in
+    the store.
+
+    The generation is changed with atomic operations only. If it is
+    missing (e.g. because the store evicted it), it is initialised to
+    a new time-based value rather than starting over, so that entries
+    of earlier generations are never served again. """
+
+    def _generation(self, namespace):
+        key = namespace + ':generation'
+        generation = self._read_counter(key)
+        while generation is None:
+            self._add_counter(key, _new_generation())
+            generation = self._read_counter(key)
+        return generation
+
+    def _key(self, namespace, key):
+        generation = self._generation(namespace)
+        return '%s:%s:%s' % (namespace, generation, key)
+
+    def _get(self, namespace, key):
+        return self._read(self._key(namespace, key))
+
+    def put(self, namespace, key, value):
+        self._write(self._key(namespace, key), value)
+
+    def clear(self, namespace):
+        key = namespace + ':generation'
+        while not self._add_counter(key, _new_generation()):
+            if self._incr_counter(key) is not None:
+                break
+
+
+def _new_generation():
+    return int(time() * 1000000)
+
+
+class MemoryBackend(GenerationBackend):
+    """ An in-process LRU cache, holding at most ``max_entries``
+    results. It is fast but not shared between processes. """
+
+    name = 'memory'
+
+    def __init__(self, ttl=0, max_entries=1000):
+        super(MemoryBackend, self).__init__(ttl=ttl)
+        self.data = LRUCache(maxsize=max_entries)
+        self.generations = {}
+        self.expired = 0
+        self.mutex = Lock()
+
+    def _read(self, key):
+        with self.mutex:
+            entry = self.data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires < time():
+                del self.data[key]
+                self.expired += 1
+                return None
+            return value
+
+    def _write(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time() + ttl if ttl else None
+        with self.mutex:
+            self.data[key] = (expires, value)
+
+    def _read_counter(self, key):
+        with self.mutex:
+            return self.generations.get(key)
+
+    def _add_counter(self, key, value):
+        with self.mutex:
+            if key in self.generations:
+                return False
+            self.generations[key] = value
+            return True
+
+    def _incr_counter(self, key):
+        with self.mutex:
+            if key not in self.generations:
+                return None
+            self.generations[key] += 1
+            return self.generations[key]
+
+    def stats(self):
+        stats = super(MemoryBackend, self).stats()
+        stats['evictions'] = self.data.evictions + self.expired
+        stats['size'] = len(self.data)
+        stats['maxsize'] = self.data.maxsize
+        return stats
+
+
+class SharedBackend(GenerationBackend):
+    """ A cache shared by all processes through a Memcached or Redis
+    server. Results are pickled; those larger than ``max_item_size``
+    bytes are not stored. """
+
+    def __init__(self, client, name, ttl=0, max_item_size=1024*1024):
+        super(SharedBackend, self).__init__(ttl=ttl)
+        self.client = client
+        self.name = name
+        self.max_item_size = max_item_size
+        self.rejected = 0
+
+    def _read(self, key):
+        data = self.client.get(key)
+        if data is None:
+            return None
+        return pickle.loads(data)
+
+    def _write(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if self.max_item_size and len(data) > self.max_item_size:
+            log.debug("Not caching %s, too large: %s bytes", key, len(data))
+            self.rejected += 1
+            return
+        self.client.set(key, data, ttl)
+
+    def _read_counter(self, key):
+        value = self.client.get(key)
+        return None if value is None else int(value)
+
+    def _add_counter(self, key, value):
+        return self.client.add(key, str(value), 0)
+
+    def _incr_counter(self, key):
+        return self.client.incr(key)
+
+    def lock(self, namespace, key, timeout):
+        return self.client.add(self._key(namespace, key) + ':lock',
+                               '1', timeout)
+
+    def unlock(self, namespace, key):
+        self.client.delete(self._key(namespace, key) + ':lock')
+
+    def stats(self):
+        stats = super(SharedBackend, self).stats()
+        stats['rejected'] = self.rejected
+        return stats
+
+
+class _MemcachedClient(object):
+
+    def __init__(self, url):
+        import memcache
+        self.client = memcache.Client(url.split(','))
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, data, ttl):
+        self.client.set(key, data, time=ttl)
+
+    def add(self, key, data, ttl):
+        return bool(self.client.add(key, data, time=ttl))
+
+    def incr(self, key):
+        return self.client.incr(key)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+
+class _RedisClient(object):
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.StrictRedis.from_url(url)
+        self._incr = self.client.register_script(
+            "if redis.call('exists', KEYS[1]) == 1 then "
+            "return redis.call('incr', KEYS[1]) end")
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, data, ttl):
+        self.client.set(key, data, ex=ttl or None)
+
+    def add(self, key, data, ttl):
+        return bool(self.client.set(key, data, ex=ttl or None, nx=True))
+
+    def incr(self, key):
+        # INCR would start a missing key at 1, reusing old generations
+        return self._incr(keys=[key])
+
+    def delete(self, key):
+        self.client.delete(key)
+
+
+class _StubClient(object):
+    """ Fakes a Memcached or Redis server within the process, to avoid
+    needing a real instance for testing. """
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, data, ttl):
+        self.data[key] = data
+
+    def add(self, key, data, ttl):
+        if key in self.data:
+            return False
+        self.data[key] = data
+        return True
+
+    def incr(self, key):
+        if key not in self.data:
+            return None
+        self.data[key] = str(int(self.data[key]) + 1)
+        return int(self.data[key])
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+# Cache backend singleton
+_backend = None
+
+def get_backend():
+    """ Returns the cache backend selected in the configuration,
+    creating it as required. """
+    global _backend
+    if _backend is not None:
+        return _backend
+
+    name = config.get('openspending.cache.backend', 'dbm')
+    ttl = int(config.get('openspending.cache.ttl', 0))
+    if name == 'dbm':
+        _backend = DbmBackend(ttl=ttl)
+    elif name == 'memory':
+        max_entries = int(config.get('openspending.cache.max_entries', 1000))
+        _backend = MemoryBackend(ttl=ttl, max_entries=max_entries)
+    elif name in ('memcached', 'redis'):
+        url = config.get('openspending.cache.url')
+        if url == 'stub':
+            client = _StubClient()
+        elif name == 'memcached':
+            client = _MemcachedClient(url or '127.0.0.1:11211')
+        else:
+            client = _RedisClient(url or 'redis://localhost:6379/0')
+        max_item_size = int(config.get('openspending.cache.max_item_size',
+                                       1024*1024))
+        _backend = SharedBackend(client, name, ttl=ttl,
+                                 max_item_size=max_item_size)
+    else:
+        raise ValueError("Unknown cache backend: %s" % name)
+    return _backend
+
+def reset_backend():
+    """ Discard the current backend, e.g. after a configuration
+    change. """
+    global _backend
+    _backend = None
+
+class _Flight(object):
+    """ A computation which other threads can wait for. """
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+_flights = {}
+_flights_lock = Lock()
+
+def single_flight(key, func):
+    """ Call ``func`` unless another thread of this process is already
+    computing ``key``, in which case its result is awaited and returned
+    instead. """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+    try:
+        flight.result = func()
+        return flight.result
+    except Exception, e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
 class AggregationCache(object):
     """ A proxy object to run cached calls against the dataset 
     aggregation function. This is neither a concern of the data 
     model itself, nor should it be repeated at each location 
     where caching of aggreagtes should occur - thus it ends up 
-    here. """
+    here.
 
-    def __init__(self, dataset, type='dbm'):
+    Concurrent misses for the same key are coalesced: only one
+    request per process runs the aggregation, and with a shared
+    backend only one per cluster, while the others wait for it.
+    """
+
+    # Seconds to wait for another worker's result before giving up
+    # and computing it anyway.
+    LOCK_TIMEOUT = 60
+
+    def __init__(self, dataset, backend=None):
         self.dataset = dataset
         opt = config.get('openspending.cache_enabled', 'True')
         self.cache_enabled = asbool(opt) and \
                 not self.dataset.private
-        self.cache = cache.get_cache('DSCACHE_' + dataset.name,
-                                     type=type)
+        self.backend = backend or get_backend()
+        self.namespace = 'DSCACHE_' + dataset.name
+
+    def key(self, measure='amount', drilldowns=None, cuts=None,
+            page=1, pagesize=10000, order=None):
+        """ Compute the cache key of an aggregation query. It includes
+        the ``data_version`` of the dataset, so that results computed
+        before the data changed are never used again (and age out of
+        the cache). The key can also serve as an HTTP ETag. """
+        key_parts = {'m': measure,
+                     'd': sorted(drilldowns or []),
+                     'c': sorted(cuts or []),
+                     'o': order,
+                     'p': page,
+                     's': pagesize,
+                     'v': self.dataset.data_version}
+        # Serialize as JSON, so that str and unicode arguments (e.g.
+        # from a URL or a view definition) produce the same key.
+        key_parts = dumps(key_parts, sort_keys=True, default=unicode)
+        return hashlib.sha1(key_parts).hexdigest()
 
     def aggregate(self, measure='amount', drilldowns=None, cuts=None,
         page=1, pagesize=10000, order=None):
@@ -35,44 +445,63 @@ class AggregationCache(object):
                                           pagesize=pagesize,
                                           order=order)
 
-        key_parts = {'m': measure,
-                     'd': sorted(drilldowns or []),
-                     'c': sorted(cuts or []),
-                     'o': order}
-        key = hashlib.sha1(repr(key_parts)).hexdigest()
-
-        if self.cache.has_key(key):
+        key = self.key(measure=measure, drilldowns=drilldowns,
+                       cuts=cuts, page=page, pagesize=pagesize,
+                       order=order)
+        result = self.backend.get(self.namespace, key)
+        if result is not None:
             log.debug("Cache hit: %s", key)
-            result = self.cache.get(key)
         else:
-            log.debug("Generating: %s", key)
-            # Note that we're not passing pagination options. Since
-            # the computational effort of giving a page is the same
-            # as returning all, we're taking the network hit and 
-            # storing the full result set in all cases.
-            result = self.dataset.aggregate(measure=measure,
-                                            drilldowns=drilldowns,
-                                            cuts=cuts,
-                                            page=1,
-                                            pagesize=maxint,
-                                            order=order)
-            self.cache.put(key, result)
-
-        # Restore pagination by splicing the cached result.
-        offset = ((page-1)*pagesize)
-        drilldown = result['drilldown']
+            # Each page is cached on its own, so that neither the
+            # database nor the cache need to hold all cells of large
+            # drilldowns.
+            def generate():
+                return self.dataset.aggregate(measure=measure,
+                                              drilldowns=drilldowns,
+                                              cuts=cuts,
+                                              page=page,
+                                              pagesize=pagesize,
+                                              order=order)
+            result = single_flight(self.namespace + ':' + key,
+                                   lambda: self._generate(key, generate))
+
+        # The result may be shared with the cache, so copy it before
+        # changing it.
+        result = dict(result)
+        result['summary'] = dict(result['summary'])
         result['summary']['cached'] = True
         result['summary']['cache_key'] = key
-        result['summary']['num_drilldowns'] = len(drilldown)
-        result['summary']['page'] = page
-        result['summary']['pages'] = int(math.ceil(len(drilldown)/float(pagesize)))
-        result['summary']['pagesize'] = pagesize
-        result['drilldown'] = drilldown[offset:offset+pagesize]
         return result
 
+    def _generate(self, key, generate):
+        """ Compute and store a missing result, unless another worker
+        holds the backend lock for it: then poll for its result until
+        the lock is released or times out. """
+        deadline = time() + self.LOCK_TIMEOUT
+        locked = self.backend.lock(self.namespace, key, self.LOCK_TIMEOUT)
+        while not locked and time() < deadline:
+            sleep(0.1)
+            result = self.backend.get(self.namespace, key)
+            if result is not None:
+                return result
+            locked = self.backend.lock(self.namespace, key,
+                                       self.LOCK_TIMEOUT)
+        try:
+            log.debug("Generating: %s", key)
+            result = generate()
+            self.backend.put(self.namespace, key, result)
+            return result
+        finally:
+            if locked:
+                self.backend.unlock(self.namespace, key)
+
     def invalidate(self):
         """ Clear the cache. """
-        self.cache.clear()
+        self.backend.clear(self.namespace)
+
+    def stats(self):
+        """ Hit, miss and eviction counts of the cache backend. """
+        return self.backend.stats()
 
 
 
@@ -0,0 +1,136 @@
+'''
+WSGI middleware to compress responses with gzip or deflate, as
+negotiated through the client's ``Accept-Encoding`` header.
+'''
+import zlib
+
+# Content types which are worth compressing.
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript',
+                      'application/xml', 'application/rdf+xml')
+
+def accepted_encoding(accept_encoding):
+    """ Pick ``gzip`` or ``deflate`` from an ``Accept-Encoding`` header,
+    or return ``None`` if neither is accepted. """
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        params = part.strip().split(';')
+        coding, q = params[0].strip().lower(), 1.0
+        for param in params[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    for coding in ('gzip', 'deflate'):
+        if accepted.get(coding, accepted.get('*', 0.0)) > 0.0:
+            return coding
+
+
+class GzipMiddleware(object):
+    """ Compress responses of compressible content types once they
+    exceed ``threshold`` bytes. Streamed responses (e.g. generated CSV
+    or JSON exports) are compressed chunk by chunk as they are produced,
+    after buffering only as much as is needed to decide on the
+    threshold. Responses which already have a ``Content-Encoding`` are
+    passed through. """
+
+    def __init__(self, app, threshold=1024, level=6):
+        self.app = app
+        self.threshold = threshold
+        self.level = level
+
+    def __call__(self, environ, start_response):
+        coding = accepted_encoding(environ.get('HTTP_ACCEPT_ENCODING'))
+        if coding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+
+        state = {}
+        written = []
+
+        def _start_response(status, headers, exc_info=None):
+            if exc_info is not None and 'started' in state:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            state['status'] = status
+            state['headers'] = headers
+            state['exc_info'] = exc_info
+            return written.append
+
+        result = self.app(environ, _start_response)
+        return self._respond(result, written, state, coding,
+                             start_response)
+
+    def _compressible(self, status, headers):
+        if not status.startswith('200'):
+            return False
+        content_type, length = '', None
+        for name, value in headers:
+            name = name.lower()
+            if name == 'content-encoding':
+                return False
+            elif name == 'content-type':
+                content_type = value.lower()
+            elif name == 'content-length':
+                length = value
+        if length is not None and int(length) < self.threshold:
+            return False
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    def _respond(self, result, written, state, coding, start_response):
+        try:
+            chunks = iter(result)
+            buf = list(written)
+            if 'status' not in state:
+                # the application is a generator itself and only calls
+                # start_response once it is iterated.
+                for chunk in chunks:
+                    buf.append(chunk)
+                    break
+            status, headers = state['status'], state['headers']
+            if not self._compressible(status, headers):
+                state['started'] = True
+                start_response(status, headers, state['exc_info'])
+                for data in buf:
+                    yield data
+                for chunk in chunks:
+                    yield chunk
+                return
+
+            # Buffer until the threshold is reached to see whether the
+            # response is big enough to be worth compressing.
+            size = sum(map(len, buf))
+            if size < self.threshold:
+                for chunk in chunks:
+                    buf.append(chunk)
+                    size += len(chunk)
+                    if size >= self.threshold:
+                        break
+            state['started'] = True
+            if size < self.threshold:
+                start_response(status, headers, state['exc_info'])
+                yield ''.join(buf)
+                return
+
+            vary = [v for (n, v) in headers if n.lower() == 'vary' and \
+                    'accept-encoding' not in v.lower()]
+            headers = [(n, v) for (n, v) in headers if n.lower() not in \
+                       ('content-length', 'vary')]
+            headers.append(('Vary', ', '.join(vary + ['Accept-Encoding'])))
+            headers.append(('Content-Encoding', coding))
+            start_response(status, headers, state['exc_info'])
+
+            # zlib writes a gzip header with 16 added to the window bits.
+            wbits = zlib.MAX_WBITS | 16 if coding == 'gzip' else zlib.MAX_WBITS
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, wbits)
+            data = compressor.compress(''.join(buf))
+            if data:
+                yield data
+            for chunk in chunks:
+                data = compressor.compress(chunk)
+                if data:
+                    yield data
+            yield compressor.flush()
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
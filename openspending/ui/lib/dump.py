@@ -0,0 +1,138 @@
+'''
+Full exports of all entries of a dataset, read directly from the
+database instead of paging through the search index. Exports are kept
+on disk as gzip-compressed dump files, one per data version of the
+dataset, so that repeated downloads do not hit the database at all.
+'''
+import os
+import gzip
+import logging
+from tempfile import mkstemp
+
+from pylons import config
+
+from openspending.lib.csvexport import generate_csv, entry_fields
+from openspending.lib.jsonexport import generate_browser_json
+
+log = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'json')
+
+# Size (in bytes) of the chunks read from a dump file.
+CHUNK_SIZE = 64 * 1024
+
+def dump_path(dataset, format):
+    """ The location of the dump file for the current data version. The
+    id is included in case a dataset is deleted and created again. """
+    base = config.get('pylons.cache_dir') or config.get('cache_dir')
+    return os.path.join(base, 'dumps', dataset.name, '%s-%s.%s.gz' % \
+                        (dataset.id, dataset.data_version or 0, format))
+
+def generate_entries(dataset, format):
+    """ Generate an export of all entries, straight from the database. """
+    entries = dataset.entries()
+    if format == 'csv':
+        return generate_csv(entries, fields=entry_fields(dataset))
+    return generate_browser_json(entries, {}, {}, None)
+
+def generate_dump(dataset, format, gzipped=False):
+    """ Generate an export of all entries, either gzip-compressed or
+    plain. The dump file is used if it exists; otherwise the export is
+    generated from the database and stored as the dump file on the way.
+    """
+    path = dump_path(dataset, format)
+    if os.path.exists(path):
+        return _read_dump(path, gzipped)
+    return _write_dump(path, generate_entries(dataset, format), gzipped)
+
+def build_dump(dataset, format):
+    """ Create the dump file for the current data version in advance. """
+    if not os.path.exists(dump_path(dataset, format)):
+        for chunk in generate_dump(dataset, format, gzipped=True):
+            pass
+
+def _read_dump(path, gzipped):
+    fh = open(path, 'rb') if gzipped else gzip.open(path, 'rb')
+    try:
+        while True:
+            chunk = fh.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fh.close()
+
+
+class _Tee(object):
+    """ A file-like object which keeps a copy of all data written to
+    the file, so that compressed output can also be sent to a client.
+    """
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.data = []
+
+    def write(self, data):
+        self.fh.write(data)
+        self.data.append(data)
+
+    def flush(self):
+        self.fh.flush()
+
+    def read(self):
+        data, self.data = ''.join(self.data), []
+        return data
+
+
+def _write_dump(path, chunks, gzipped):
+    dirname = os.path.dirname(path)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    # Write to a temporary file first, so that concurrent or aborted
+    # downloads never leave an incomplete dump behind.
+    fd, tmp = mkstemp(dir=dirname, suffix='.tmp')
+    fh = os.fdopen(fd, 'wb')
+    tee = _Tee(fh)
+    gz = gzip.GzipFile(fileobj=tee, mode='wb')
+    complete = False
+    try:
+        for chunk in chunks:
+            gz.write(chunk)
+            if gzipped:
+                yield tee.read()
+            else:
+                tee.read()
+                yield chunk
+        gz.close()
+        if gzipped:
+            yield tee.read()
+        complete = True
+    finally:
+        fh.close()
+        if complete:
+            os.rename(tmp, path)
+            _remove_old_dumps(path)
+        else:
+            os.unlink(tmp)
+
+def _dump_version(filename):
+    """ The dataset id and data version of a dump file name, as written
+    by ``dump_path``, or ``None`` for other files. """
+    try:
+        version = filename.split('.', 1)[0]
+        return tuple(int(v) for v in version.split('-', 1))
+    except ValueError:
+        return None
+
+def _remove_old_dumps(path):
+    """ Delete the dump files of earlier data versions. Dumps of later
+    versions are kept, even if they were written before this one. """
+    dirname, filename = os.path.split(path)
+    version, format = _dump_version(filename), filename.split('.', 1)[1]
+    for name in os.listdir(dirname):
+        if not name.endswith('.' + format):
+            continue
+        other = _dump_version(name)
+        if other is not None and other < version:
+            log.debug("Removing old dump: %s", name)
+            os.unlink(os.path.join(dirname, name))
@@ -139,6 +139,27 @@ class ViewState(object):
         return self._aggregates
 
 
+def warm_cache(dataset):
+    """ Run the aggregations needed to render the dataset's views and
+    the pages of its compound dimensions, so that they are already held
+    in the aggregation cache when the first visitor arrives. """
+    queries = []
+    for view in View.available(dataset, dataset):
+        queries.append({'drilldowns': ['year'], 'cuts': view.cuts.items()})
+        if view.drilldown is not None:
+            queries.append({'drilldowns': ['year', view.drilldown],
+                            'cuts': view.cuts.items()})
+    for dimension in dataset.compounds:
+        queries.append({'drilldowns': [dimension.name]})
+
+    cache = AggregationCache(dataset)
+    for query in queries:
+        try:
+            cache.aggregate(**query)
+        except Exception, e:
+            log.warn("Cannot pre-compute aggregate %r: %s", query, e)
+    return len(queries)
+
 
 def _set_time_context(request, c):
     # TODO: this is an unholy mess that needs to be killed
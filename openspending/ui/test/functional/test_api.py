@@ -12,12 +12,12 @@ class TestApiController(ControllerTestCase):
         response = self.app.get(url(controller='api',
                                     action='aggregate',
                                     dataset='cra'))
-        assert '"metadata": {' in response, response
-        assert '"dataset": "cra"' in response, response
-        assert '"include": []' in response, response
+        assert '"metadata":{' in response, response
+        assert '"dataset":"cra"' in response, response
+        assert '"include":[]' in response, response
         assert '"dates":' in response, response
-        assert '"axes": []' in response, response
-        assert '"results": [' in response
+        assert '"axes":[]' in response, response
+        assert '"results":[' in response
 
     def test_aggregate_with_breakdown(self):
         u = url(controller='api', action='aggregate', **{
@@ -66,18 +66,31 @@ class TestApiController(ControllerTestCase):
     def test_mytax(self):
         u = url(controller='api', action='mytax', income=20000)
         response = self.app.get(u)
-        assert '"tax": ' in response, response
-        assert '"explanation": ' in response, response
+        assert '"tax":' in response, response
+        assert '"explanation":' in response, response
         # TODO: check amounts still work.
 
+    def test_mytax_batch(self):
+        u = url(controller='api', action='mytax_batch',
+                incomes='10000,20000,200000', smoker='no')
+        response = self.app.get(u)
+        results = json.loads(response.body)['results']
+        h.assert_equal([r['income'] for r in results],
+                       [10000.0, 20000.0, 200000.0])
+        h.assert_equal(results[0]['tobacco_tax'], 0)
+        assert results[1]['tax'] > results[0]['tax'], results
+
+        u = url(controller='api', action='mytax_batch', incomes='10,x')
+        self.app.get(u, status=400)
+
     def test_jsonp_mytax(self):
         # Copied from test_mytax.
         callback = randomjsonpcallback()
         u = url(controller='api', action='mytax', income=20000,
           callback=callback)
         response = self.app.get(u)
-        assert '"tax": ' in response, response
-        assert '"explanation": ' in response, response
+        assert '"tax":' in response, response
+        assert '"explanation":' in response, response
         assert valid_jsonp(response, callback)
 
 
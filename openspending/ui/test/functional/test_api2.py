@@ -72,3 +72,33 @@ class TestApi2Controller(ControllerTestCase):
         h.assert_equal(unique(order),
                          map(unicode, [2010, 2009, 2008, 2007, 2006, 2005, 2004,
                              2003]))
+
+    def test_etag(self):
+        from pylons import config
+        from openspending import model
+        from openspending.model import meta as db
+        db.session.commit()
+        config['openspending.cache_enabled'] = 'True'
+        try:
+            aggregate = url(controller='api2', action='aggregate',
+                            dataset='cra', drilldown='year')
+            response = self.app.get(aggregate)
+            etag = response.headers['ETag']
+            response = self.app.get(aggregate, status=304,
+                                    headers={'If-None-Match': etag})
+
+            dataset = model.Dataset.by_name('cra')
+            dataset.touch()
+            db.session.commit()
+            response = self.app.get(aggregate,
+                                    headers={'If-None-Match': etag})
+            h.assert_equal(response.status, '200 OK')
+            assert response.headers['ETag'] != etag, etag
+        finally:
+            config['openspending.cache_enabled'] = 'False'
+
+    def test_dataset_subdomain(self):
+        response = self.app.get(url(controller='api2', action='aggregate',
+                                    dataset='cra'),
+                                extra_environ={'HTTP_HOST': 'CRA.localhost'})
+        h.assert_equal(response.status, '200 OK')
@@ -31,3 +31,41 @@ class TestEntryController(ControllerTestCase):
         assert tpl % (t['id'], t['name']) in response, \
                'Custom HTML not present in rendered page!'
 
+
+    def test_index_csv_dump(self):
+        import csv, gzip, os, shutil
+        from StringIO import StringIO
+        from openspending.ui.lib.dump import dump_path
+        db.session.commit()
+        path = dump_path(self.cra, 'csv')
+        if os.path.isdir(os.path.dirname(path)):
+            shutil.rmtree(os.path.dirname(path))
+
+        response = self.app.get(url(controller='entry', action='index',
+                                    dataset='cra', format='csv'))
+        h.assert_equal(response.content_type, 'text/csv')
+        rows = list(csv.DictReader(StringIO(response.body)))
+        h.assert_equal(len(rows), 36)
+        assert os.path.exists(path), path
+
+        response = self.app.get(url(controller='entry', action='index',
+                                    dataset='cra', format='csv'),
+                                headers={'Accept-Encoding': 'gzip'})
+        h.assert_equal(response.headers['Content-Encoding'], 'gzip')
+        data = gzip.GzipFile(fileobj=StringIO(response.body)).read()
+        h.assert_equal(len(list(csv.DictReader(StringIO(data)))), 36)
+
+        response = self.app.get(url(controller='entry', action='index',
+                                    dataset='cra', format='csv'),
+                                headers={'Accept-Encoding': 'gzip;q=0'})
+        assert 'Content-Encoding' not in response.headers, response.headers
+        h.assert_equal(len(list(csv.DictReader(StringIO(response.body)))),
+                       36)
+
+    def test_index_json_dump(self):
+        from openspending.lib import json
+        response = self.app.get(url(controller='entry', action='index',
+                                    dataset='cra', format='json',
+                                    limit='all'))
+        results = json.loads(response.body)['results']
+        h.assert_equal(len(results), 36)
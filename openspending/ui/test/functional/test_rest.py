@@ -19,7 +19,7 @@ class TestRestController(ControllerTestCase):
                                     format='json',
                                     dataset=self.cra.name))
 
-        assert '"name": "cra"' in response, response
+        assert '"name":"cra"' in response, response
 
     def test_entry(self):
         q = self.cra['from'].alias.c.name=='Dept047'
@@ -0,0 +1,173 @@
+from threading import Event, Semaphore, Thread
+
+from ... import DatabaseTestCase, TestCase, helpers as h
+
+from pylons import config
+
+from openspending import model
+from openspending.ui.lib.cache import AggregationCache, MemoryBackend, \
+        SharedBackend, _StubClient, _flights, single_flight
+
+
+class TestMemoryBackend(TestCase):
+
+    def test_get_put(self):
+        backend = MemoryBackend()
+        assert backend.get('ns', 'a') is None
+        backend.put('ns', 'a', {'foo': 1})
+        h.assert_equal(backend.get('ns', 'a'), {'foo': 1})
+        stats = backend.stats()
+        h.assert_equal(stats['hits'], 1)
+        h.assert_equal(stats['misses'], 1)
+
+    def test_max_entries(self):
+        backend = MemoryBackend(max_entries=3)
+        for i in range(5):
+            backend.put('ns', str(i), i)
+        assert backend.get('ns', '0') is None
+        h.assert_equal(backend.get('ns', '4'), 4)
+        assert backend.stats()['evictions'] > 0, backend.stats()
+
+    def test_ttl(self):
+        backend = MemoryBackend(ttl=-1)
+        backend.put('ns', 'a', 1)
+        assert backend.get('ns', 'a') is None
+        h.assert_equal(backend.stats()['evictions'], 1)
+
+    def test_clear(self):
+        backend = MemoryBackend()
+        backend.put('ns', 'a', 1)
+        backend.put('other', 'a', 2)
+        backend.clear('ns')
+        assert backend.get('ns', 'a') is None
+        h.assert_equal(backend.get('other', 'a'), 2)
+
+
+class TestSharedBackend(TestCase):
+
+    def test_shared(self):
+        client = _StubClient()
+        first = SharedBackend(client, 'memcached')
+        second = SharedBackend(client, 'memcached')
+        first.put('ns', 'a', {'foo': [1, 2]})
+        h.assert_equal(second.get('ns', 'a'), {'foo': [1, 2]})
+        second.clear('ns')
+        assert first.get('ns', 'a') is None
+
+    def test_generation_evicted(self):
+        client = _StubClient()
+        backend = SharedBackend(client, 'memcached')
+        backend.put('ns', 'a', 1)
+        backend.clear('ns')
+        backend.put('ns', 'a', 2)
+        # the store loses the generation, but must not fall back to an
+        # earlier one:
+        client.delete('ns:generation')
+        assert backend.get('ns', 'a') is None
+        backend.put('ns', 'a', 3)
+        client.delete('ns:generation')
+        backend.clear('ns')
+        assert backend.get('ns', 'a') is None
+
+    def test_max_item_size(self):
+        backend = SharedBackend(_StubClient(), 'redis', max_item_size=100)
+        backend.put('ns', 'a', 'x' * 1000)
+        assert backend.get('ns', 'a') is None
+        h.assert_equal(backend.stats()['rejected'], 1)
+
+
+class TestSingleFlight(TestCase):
+
+    def test_coalesce(self):
+        started, release = Event(), Event()
+        calls, results = [], []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return 42
+
+        leader = Thread(target=lambda: results.append(
+            single_flight('key', compute)))
+        leader.start()
+        started.wait()
+
+        # count the followers waiting for the leader's flight
+        flight, waiting = _flights['key'], Semaphore(0)
+        wait = flight.done.wait
+        def counting_wait(*args):
+            waiting.release()
+            return wait(*args)
+        flight.done.wait = counting_wait
+
+        followers = [Thread(target=lambda: results.append(
+            single_flight('key', compute))) for i in range(3)]
+        for follower in followers:
+            follower.start()
+        for follower in followers:
+            waiting.acquire()
+        release.set()
+        for thread in [leader] + followers:
+            thread.join()
+        h.assert_equal(len(calls), 1)
+        h.assert_equal(results, [42] * 4)
+
+    def test_error(self):
+        def fail():
+            raise ValueError()
+        h.assert_raises(ValueError, single_flight, 'key', fail)
+        h.assert_equal(single_flight('key', lambda: 1), 1)
+
+
+class TestAggregationCache(DatabaseTestCase):
+
+    def setup(self):
+        super(TestAggregationCache, self).setup()
+        h.load_fixture('cra')
+        self.dataset = model.Dataset.by_name('cra')
+        config['openspending.cache_enabled'] = 'True'
+
+    def teardown(self):
+        config['openspending.cache_enabled'] = 'False'
+        super(TestAggregationCache, self).teardown()
+
+    def test_aggregate(self):
+        cache = AggregationCache(self.dataset, backend=MemoryBackend())
+        res = cache.aggregate(drilldowns=['cofog1'], pagesize=2)
+        h.assert_equal(len(res['drilldown']), 2)
+        assert res['summary']['pages'] > 1, res['summary']
+        second = cache.aggregate(drilldowns=['cofog1'], page=2, pagesize=2)
+        for cell in second['drilldown']:
+            assert cell not in res['drilldown'], cell
+        full = cache.aggregate(drilldowns=['cofog1'])
+        assert len(full['drilldown']) > 2, full
+        h.assert_equal(full['summary']['amount'], res['summary']['amount'])
+        h.assert_equal(cache.aggregate(drilldowns=['cofog1'], pagesize=2),
+                       res)
+        stats = cache.stats()
+        h.assert_equal(stats['hits'], 1)
+        h.assert_equal(stats['misses'], 3)
+
+        cache.invalidate()
+        cache.aggregate(drilldowns=['cofog1'])
+        h.assert_equal(cache.stats()['misses'], 4)
+
+    def test_wait_for_lock(self):
+        backend = SharedBackend(_StubClient(), 'memcached')
+        cache = AggregationCache(self.dataset, backend=backend)
+        key = cache.key(drilldowns=['cofog1'])
+        result = self.dataset.aggregate(drilldowns=['cofog1'])
+        # another worker is computing the result:
+        assert backend.lock(cache.namespace, key, 60)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("Aggregate was computed twice.")
+        self.dataset.aggregate = fail
+
+        def finish():
+            backend.put(cache.namespace, key, result)
+            backend.unlock(cache.namespace, key)
+        Thread(target=finish).start()
+        res = cache.aggregate(drilldowns=['cofog1'])
+        h.assert_equal(res['drilldown'], result['drilldown'])
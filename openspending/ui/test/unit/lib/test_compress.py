@@ -0,0 +1,66 @@
+import gzip
+import zlib
+from StringIO import StringIO
+
+from webtest import TestApp
+
+from ... import TestCase, helpers as h
+
+from openspending.ui.lib.compress import GzipMiddleware, accepted_encoding
+
+def make_app(chunks, content_type='text/csv', headers=None):
+    def app(environ, start_response):
+        start_response('200 OK', [('Content-Type', content_type)] + \
+                       (headers or []))
+        for chunk in chunks:
+            yield chunk
+    return TestApp(GzipMiddleware(app, threshold=100))
+
+class TestGzipMiddleware(TestCase):
+
+    def test_accepted_encoding(self):
+        h.assert_equal(accepted_encoding('gzip, deflate'), 'gzip')
+        h.assert_equal(accepted_encoding('deflate'), 'deflate')
+        h.assert_equal(accepted_encoding('gzip;q=0, deflate'), 'deflate')
+        h.assert_equal(accepted_encoding('*'), 'gzip')
+        h.assert_equal(accepted_encoding('identity'), None)
+        h.assert_equal(accepted_encoding(None), None)
+
+    def test_gzip_stream(self):
+        chunks = ['a,b,c\n'] + ['1,2,3\n'] * 1000
+        app = make_app(chunks)
+        res = app.get('/', headers={'Accept-Encoding': 'gzip'})
+        h.assert_equal(res.headers['Content-Encoding'], 'gzip')
+        h.assert_equal(res.headers['Vary'], 'Accept-Encoding')
+        data = gzip.GzipFile(fileobj=StringIO(res.body)).read()
+        h.assert_equal(data, ''.join(chunks))
+        assert len(res.body) < len(data) / 10, len(res.body)
+
+    def test_deflate(self):
+        chunks = ['x' * 1000]
+        res = make_app(chunks).get('/', headers={'Accept-Encoding': 'deflate'})
+        h.assert_equal(res.headers['Content-Encoding'], 'deflate')
+        h.assert_equal(zlib.decompress(res.body), chunks[0])
+
+    def test_not_accepted(self):
+        res = make_app(['x' * 1000]).get('/')
+        assert 'Content-Encoding' not in res.headers, res.headers
+        h.assert_equal(res.body, 'x' * 1000)
+
+    def test_below_threshold(self):
+        res = make_app(['x' * 10, 'y' * 10]).get('/',
+                headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in res.headers, res.headers
+        h.assert_equal(res.body, 'x' * 10 + 'y' * 10)
+
+    def test_incompressible(self):
+        res = make_app(['x' * 1000], content_type='image/png').get('/',
+                headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in res.headers, res.headers
+
+    def test_already_encoded(self):
+        body = zlib.compress('x' * 1000)
+        res = make_app([body], headers=[('Content-Encoding', 'deflate')])\
+                .get('/', headers={'Accept-Encoding': 'gzip'})
+        h.assert_equal(res.headers['Content-Encoding'], 'deflate')
+        h.assert_equal(res.body, body)
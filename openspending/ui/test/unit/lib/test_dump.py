@@ -0,0 +1,27 @@
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from ... import TestCase, helpers as h
+
+from openspending.ui.lib.dump import _remove_old_dumps
+
+
+class TestRemoveOldDumps(TestCase):
+
+    def setup(self):
+        self.tmpdir = mkdtemp()
+
+    def teardown(self):
+        rmtree(self.tmpdir)
+
+    def test_remove_old_dumps(self):
+        names = ['1-2.csv.gz', '1-3.csv.gz', '1-4.csv.gz', '2-1.csv.gz',
+                 '1-2.json.gz', 'abc.tmp']
+        for name in names:
+            open(os.path.join(self.tmpdir, name), 'wb').close()
+        # the dump of version 3 finished after the one of version 4:
+        _remove_old_dumps(os.path.join(self.tmpdir, '1-3.csv.gz'))
+        h.assert_equal(sorted(os.listdir(self.tmpdir)),
+                       ['1-2.json.gz', '1-3.csv.gz', '1-4.csv.gz',
+                        '2-1.csv.gz', 'abc.tmp'])
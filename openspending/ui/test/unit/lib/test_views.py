@@ -1,7 +1,10 @@
 from ... import DatabaseTestCase, helpers as h
 
+from pylons import config
+
 from openspending import model
-from openspending.ui.lib.views import View
+from openspending.ui.lib.cache import AggregationCache
+from openspending.ui.lib.views import View, ViewState, warm_cache
 
 class TestViews(DatabaseTestCase):
     def setup(self):
@@ -46,3 +49,23 @@ class TestViews(DatabaseTestCase):
         assert "hello" in view.full_dimensions, view.full_dimensions
         assert "hello" not in view.base_dimensions, view.base_dimensions
         assert len(view.full_dimensions) == 3
+
+    def test_warm_cache(self):
+        config['openspending.cache_enabled'] = 'True'
+        try:
+            cache = AggregationCache(self.dataset)
+            cache.invalidate()
+            num = warm_cache(self.dataset)
+            assert num > len(self.dataset.compounds), num
+
+            # all further aggregates must be served from the cache
+            def fail(*args, **kwargs):
+                raise AssertionError("Aggregate was not cached.")
+            self.dataset.aggregate = fail
+            view = View.by_name(self.dataset, self.dataset, 'default')
+            state = ViewState(self.dataset, view, None)
+            assert len(state.totals), state.totals
+            cache.aggregate(drilldowns=['cofog1'])
+            cache.invalidate()
+        finally:
+            config['openspending.cache_enabled'] = 'False'